@@ -0,0 +1,619 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, time
+import ecdsa
+import httpx
+import pymongo
+from blockchain_utils import (
+    VERSION, block_hash, compact_block, elem_hash, encode_header, encode_transaction, merkle_root, transaction_hash
+)
+from keygen import sign_ecdsa_msg, validate_signature, validate_signatures
+from miner import ParallelMiner, check_proof
+from mongo_db import Mongo
+from file_storage import FileStorage
+from schedule import Schedule
+from storage import Storage
+
+BENCH_DB = 'blockchain_bench'
+
+
+def bench_client():
+    """Local mongod if BENCH_MONGO_URI is set, mongomock otherwise"""
+    if os.environ.get('BENCH_MONGO_URI'):
+        return pymongo.MongoClient(os.environ['BENCH_MONGO_URI'])
+    import mongomock
+    return mongomock.MongoClient()
+
+
+def bench_db(name: str = BENCH_DB) -> Mongo:
+    client = bench_client()
+    client.drop_database(name)
+    return Mongo(client, name)
+
+
+def make_chain(db: Storage, blocks: int, difficult: int = 1, reward: float = 50) -> list[dict]:
+    """Append empty blocks with valid proofs and links on top of the genesis block"""
+    last_block = db.get_by_index(1)
+    previous_hash = block_hash(last_block)
+    chain = []
+    for index in range(2, blocks + 2):
+        proof = 0
+        while not check_proof(last_block['proof'], proof, difficult):
+            proof += 1
+        block = {
+            'version': VERSION,
+            'index': index,
+            'timestamp': last_block['timestamp'] + 1,
+            'transactions': [],
+            'proof': proof,
+            'previous_hash': previous_hash,
+            'difficult': difficult,
+            'reward': reward,
+            'merkle_root': merkle_root([])
+        }
+        block['hash'] = previous_hash = block_hash(block)
+        chain.append(block)
+        last_block = block
+    for start in range(0, len(chain), 10000):
+        db.append_batch(chain[start:start + 10000])
+    return chain
+
+
+def legacy_validate_chain(blockchain) -> bool:
+    last_index = blockchain.last_block['index']
+    last_block = blockchain.block_by_index(1)
+    for current_index in range(2, last_index + 1):
+        block = blockchain.block_by_index(current_index)
+        if not blockchain.validate_block(block, last_block):
+            return False
+        last_block = block
+    return True
+
+
+def legacy_validate_signature(public_key: str, signature: str, message: str) -> bool:
+    public_key = (base64.b64decode(public_key)).hex()
+    vk = ecdsa.VerifyingKey.from_string(bytes.fromhex(public_key), curve=ecdsa.SECP256k1)
+    try:
+        return vk.verify(base64.b64decode(signature), message.encode())
+    except ecdsa.BadSignatureError:
+        return False
+
+
+def legacy_proof_of_work(last_proof: int, difficult: int) -> tuple[int, int]:
+    proof = 0
+    while True:
+        guess_hash = hashlib.sha256(f'{last_proof}{proof}'.encode()).hexdigest()
+        if guess_hash[:difficult] == '0' * difficult:
+            return proof, proof + 1
+        proof += 1
+
+
+def bench_proof_of_work(difficult: int = 5, rounds: int = 3):
+    hashes = 0
+    started = perf_counter()
+    for last_proof in range(rounds):
+        hashes += legacy_proof_of_work(last_proof, difficult)[1]
+    serial_rate = hashes / (perf_counter() - started)
+    miner = ParallelMiner()
+    hashes = 0
+    elapsed = 0
+    try:
+        for last_proof in range(rounds):
+            miner.search(last_proof, difficult)
+            hashes += miner.hashes
+            elapsed += miner.elapsed
+    finally:
+        miner.close()
+    parallel_rate = hashes / elapsed
+    print(f'proof_of_work difficult={difficult} rounds={rounds}')
+    print(f'  serial loop:     {serial_rate:,.0f} H/s')
+    print(f'  parallel miner:  {parallel_rate:,.0f} H/s ({miner.workers} workers, x{parallel_rate / serial_rate:.2f})')
+
+
+def bench_validate_chain(blocks: int = 100_000, difficult: int = 1):
+    from blockchain import Blockchain
+    db = bench_db()
+    make_chain(db, blocks, difficult)
+    blockchain = Blockchain(db)
+    blockchain.schedule = Schedule(blockchain.db, difficult, epoch_blocks=0)
+    started = perf_counter()
+    legacy_validate_chain(blockchain)
+    legacy = perf_counter() - started
+    started = perf_counter()
+    blockchain.validate_chain()
+    streaming = perf_counter() - started
+    started = perf_counter()
+    blockchain.validate_chain()
+    watermark = perf_counter() - started
+    blockchain.miner.close()
+    print(f'validate_chain blocks={blocks}')
+    print(f'  find_one per block:    {legacy:.2f} s')
+    print(f'  sorted cursor:         {streaming:.2f} s')
+    print(f'  above watermark only:  {watermark:.4f} s')
+
+
+def bench_signatures(signatures: int = 2000, keys: int = 20):
+    items = []
+    for _ in range(keys):
+        sk = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
+        private_key = sk.to_string().hex()
+        public_key = base64.b64encode(sk.get_verifying_key().to_string()).decode()
+        for i in range(signatures // keys):
+            message = hashlib.sha256(f'{public_key}{i}'.encode()).hexdigest()
+            items.append((public_key, sign_ecdsa_msg(private_key, message), message))
+    rates = {}
+    for name, verify in [
+        ('legacy', lambda: [legacy_validate_signature(*item) for item in items]),
+        ('cached keys', lambda: [validate_signature(*item) for item in items]),
+        ('batch', lambda: validate_signatures(items)),
+    ]:
+        started = perf_counter()
+        assert all(verify())
+        rates[name] = len(items) / (perf_counter() - started)
+    print(f'signatures={len(items)} keys={keys}')
+    for name, rate in rates.items():
+        print(f'  {name + ":":<14} {rate:,.0f} verifications/s')
+
+
+def new_keys() -> tuple[str, str]:
+    sk = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
+    return sk.to_string().hex(), base64.b64encode(sk.get_verifying_key().to_string()).decode()
+
+
+def bench_node(name: str, difficult: int = 1, nodes: list[str] = None, transports: dict = None):
+    """Blockchain on a fresh bench database with its API app, peers are reached through transports"""
+    from blockchain import Blockchain
+    from peers import PeerClient
+    from routes import create_app
+    blockchain = Blockchain(bench_db(f'{BENCH_DB}_{name}'))
+    blockchain.schedule = Schedule(blockchain.db, difficult, epoch_blocks=0)
+    blockchain.peers = PeerClient(nodes or [], transports=transports)
+    return blockchain, create_app(blockchain)
+
+
+def start_nodes(count: int, difficult: int = 1) -> list:
+    """In-process nodes in a line, each one peers with its neighbours over ASGI transport"""
+    urls = [f'http://node{i}' for i in range(count)]
+    blockchains = []
+    transports = {}
+    for i, url in enumerate(urls):
+        blockchain, app = bench_node(str(i), difficult, urls[max(i - 1, 0):i] + urls[i + 1:i + 2], transports)
+        blockchains.append(blockchain)
+        transports[url] = httpx.ASGITransport(app=app)
+    return blockchains
+
+
+def mine_block(blockchain, secret_key: str, public_key: str) -> dict:
+    last_block = blockchain.last_block
+    proof = 0
+    while not blockchain.validate_proof(last_block['proof'], proof):
+        proof += 1
+    emission = blockchain.new_transaction(blockchain.emission_address, public_key, blockchain.reward, 0, secret_key)
+    return blockchain.new_block(proof, None, emission)
+
+
+async def _propagation(blockchains: list, blocks: int) -> list[float]:
+    secret_key, public_key = new_keys()
+    timings = []
+    for _ in range(blocks):
+        block = mine_block(blockchains[0], secret_key, public_key)
+        started = perf_counter()
+        await blockchains[0].peers.broadcast_block(block)
+        timings.append(perf_counter() - started)
+        assert all(blockchain.last_block['index'] == block['index'] for blockchain in blockchains)
+    for blockchain in blockchains:
+        await blockchain.peers.close()
+    return timings
+
+
+def bench_propagation(nodes: int = 4, blocks: int = 20):
+    blockchains = start_nodes(nodes)
+    timings = sorted(asyncio.run(_propagation(blockchains, blocks)))
+    print(f'block propagation nodes={nodes} (line) blocks={blocks}')
+    print(f'  median: {timings[len(timings) // 2] * 1000:.1f} ms, max: {timings[-1] * 1000:.1f} ms')
+
+
+async def _requests_per_second(app, paths: list[str], concurrency: int = 50) -> float:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://node') as client:
+        started = perf_counter()
+        for start in range(0, len(paths), concurrency):
+            responses = await asyncio.gather(*(client.get(path) for path in paths[start:start + concurrency]))
+            assert all(response.status_code == 200 for response in responses)
+        return len(paths) / (perf_counter() - started)
+
+
+def bench_api_load(requests: int = 2000, blocks: int = 1000):
+    from block_cache import BlockCache
+    from blockchain import Blockchain
+    from routes import create_app
+    db = bench_db()
+    make_chain(db, blocks)
+    print(f'api load requests={requests} blocks={blocks + 1}')
+    for name, cache in [('no cache', BlockCache(0)), ('cache', BlockCache())]:
+        blockchain = Blockchain(db)
+        blockchain.cache = cache
+        app = create_app(blockchain)
+        height = asyncio.run(_requests_per_second(app, ['/chain/height'] * requests))
+        paths = [f'/block/send?start={blocks - 10 - i % 100}&length=10' for i in range(requests)]
+        send = asyncio.run(_requests_per_second(app, paths))
+        blockchain.miner.close()
+        print(f'  {name + ":":<10} /chain/height {height:,.0f} req/s, /block/send {send:,.0f} req/s')
+
+
+def signed_transaction(
+        secret_key: str,
+        public_key: str,
+        recipient: str,
+        amount: float,
+        fee: float,
+        timestamp: float = None) -> dict:
+    transaction = {
+        'version': VERSION,
+        'sender': public_key,
+        'recipient': recipient,
+        'amount': round(amount, 8),
+        'timestamp': 1696793687.5 + amount if timestamp is None else timestamp,
+        'fee': round(fee, 8)
+    }
+    transaction['hash'] = transaction_hash(transaction)
+    transaction['sign'] = sign_ecdsa_msg(secret_key, transaction['hash'])
+    return transaction
+
+
+def bench_encoding(blocks: int = 200, transactions: int = 100):
+    secret_key, public_key = new_keys()
+    recipient = new_keys()[1]
+    block_transactions = [
+        signed_transaction(secret_key, public_key, recipient, i + 0.5, 0.001) for i in range(transactions)
+    ]
+    chain = [{
+        'version': VERSION,
+        'index': index,
+        'timestamp': 1696793687.5 + index,
+        'transactions': block_transactions,
+        'proof': index,
+        'previous_hash': '00' * 32,
+        'difficult': 8,
+        'reward': 50,
+        'merkle_root': merkle_root([trn['hash'] for trn in block_transactions])
+    } for index in range(blocks)]
+    header = {key: value for key, value in chain[0].items() if key != 'transactions'}
+    print(f'encoding blocks={blocks} transactions={transactions}')
+    print(f'  header json size: {len(json.dumps(header).encode()):,} bytes, '
+          f'binary size: {len(encode_header(header)):,} bytes')
+    print(f'  transaction json size: {len(json.dumps(block_transactions[0]).encode()):,} bytes, '
+          f'binary size: {len(encode_transaction(block_transactions[0])):,} bytes')
+    for name, run in [
+        ('json hash', lambda: [elem_hash(block) for block in chain]),
+        ('binary hash', lambda: [block_hash(block) for block in chain]),
+        ('tx hashes', lambda: [[transaction_hash(trn) for trn in block['transactions']] for block in chain]),
+        ('merkle root', lambda: [merkle_root([trn['hash'] for trn in block['transactions']]) for block in chain]),
+    ]:
+        started = perf_counter()
+        run()
+        print(f'  {name + ":":<13} {blocks / (perf_counter() - started):,.0f} blocks/s')
+
+
+def bench_storage(blocks: int = 10_000, reads: int = 500):
+    chain = make_chain(bench_db(f'{BENCH_DB}_source'), blocks)
+    print(f'storage blocks={blocks} reads={reads}')
+    with tempfile.TemporaryDirectory() as path:
+        for name, db in [('mongo', bench_db()), ('file', FileStorage(path))]:
+            started = perf_counter()
+            for start in range(0, len(chain), 1000):
+                db.append_batch(chain[start:start + 1000])
+            append = blocks / (perf_counter() - started)
+            started = perf_counter()
+            count = sum(1 for _ in db.range(1))
+            scan = count / (perf_counter() - started)
+            started = perf_counter()
+            for i in range(reads):
+                db.get_by_index(2 + i * 7919 % blocks)
+            lookup = reads / (perf_counter() - started)
+            started = perf_counter()
+            for _ in range(reads):
+                db.tip()
+            tip = reads / (perf_counter() - started)
+            db.close()
+            print(f'  {name + ":":<6} append {append:,.0f} blocks/s, range {scan:,.0f} blocks/s, '
+                  f'get_by_index {lookup:,.0f}/s, tip {tip:,.0f}/s')
+
+
+def bench_history(blocks: int = 2000, lookups: int = 100):
+    db = bench_db()
+    keys = [new_keys() for _ in range(10)]
+    chain = make_chain(bench_db(f'{BENCH_DB}_source'), blocks)
+    for i, block in enumerate(chain):
+        secret_key, public_key = keys[i % len(keys)]
+        block['transactions'] = [signed_transaction(secret_key, public_key, keys[(i + 1) % len(keys)][1], i + 1, 0.01)]
+    db.append_batch(chain)
+    addresses = [keys[i % len(keys)][1] for i in range(lookups)]
+    started = perf_counter()
+    for address in addresses:
+        [trn for block in db.range(1) for trn in block['transactions'] if address in (trn['sender'], trn['recipient'])]
+    scan = (perf_counter() - started) / lookups
+    started = perf_counter()
+    for address in addresses:
+        db.address_history(address, 0, 100)
+    indexed = (perf_counter() - started) / lookups
+    print(f'address history blocks={blocks} lookups={lookups}')
+    print(f'  chain scan:  {scan * 1000:.2f} ms per query')
+    print(f'  index:       {indexed * 1000:.2f} ms per query')
+
+
+def generate_chain(blockchain, blocks: int, transactions: int, keys: list[tuple[str, str]]) -> list[dict]:
+    """Funding block and `blocks` blocks with `transactions` signed transfers each, keys[0] mines and pays"""
+    secret_key, public_key = keys[0]
+    timestamp = 1696793687.5
+    mined = [mine_block(blockchain, secret_key, public_key)]
+    for _ in range(blocks):
+        for i in range(transactions):
+            timestamp += 1
+            blockchain.add_verified_transaction(
+                signed_transaction(secret_key, public_key, keys[1 + i % (len(keys) - 1)][1], 0.01, 0.0001, timestamp)
+            )
+        mined.append(mine_block(blockchain, secret_key, public_key))
+    return mined
+
+
+def _summary(timings: list[float]) -> dict:
+    timings = sorted(timings)
+    return {
+        'mean_ms': sum(timings) / len(timings) * 1000,
+        'p50_ms': timings[len(timings) // 2] * 1000,
+        'p95_ms': timings[min(len(timings) - 1, len(timings) * 95 // 100)] * 1000,
+    }
+
+
+async def _post_all(app, path: str, bodies: list[dict], concurrency: int) -> list[float]:
+    """Latency of every request, up to concurrency requests at once"""
+    timings = []
+
+    async def post(client, body):
+        started = perf_counter()
+        response = await client.post(path, json=body)
+        assert response.status_code == 200 and response.json() is True, response.text
+        timings.append(perf_counter() - started)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://node') as client:
+        for start in range(0, len(bodies), concurrency):
+            await asyncio.gather(*(post(client, body) for body in bodies[start:start + concurrency]))
+    return timings
+
+
+async def _post_batches(app, batches: list[list[dict]]):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://node') as client:
+        for batch in batches:
+            response = await client.post('/transactions/batch', json=batch)
+            assert all(response.json()), response.text
+
+
+async def _sync(blockchain) -> float:
+    started = perf_counter()
+    await blockchain.consensus()
+    elapsed = perf_counter() - started
+    await blockchain.peers.close()
+    return elapsed
+
+
+def bench_e2e(blocks: int = 50, transactions: int = 50, ingest: int = 500) -> dict:
+    """Chain validation, /block/get latency, transaction ingest rates and sync time between two nodes"""
+    keys = [new_keys() for _ in range(10)]
+    source, source_app = bench_node('source')
+    started = perf_counter()
+    chain = generate_chain(source, blocks, transactions, keys)
+    generated = perf_counter() - started
+
+    source.state.reset()
+    started = perf_counter()
+    assert source.validate_chain() is True
+    validate = perf_counter() - started
+
+    target, target_app = bench_node('target')
+    block_timings = asyncio.run(_post_all(target_app, '/block/get', chain, 1))
+    assert target.last_block['index'] == source.last_block['index']
+
+    secret_key, public_key = keys[0]
+    pending = [
+        signed_transaction(secret_key, public_key, keys[1 + i % 9][1], 0.001, 0.0001, 1896793687.5 + i)
+        for i in range(ingest)
+    ]
+    started = perf_counter()
+    asyncio.run(_post_all(target_app, '/transactions/get', pending, 50))
+    ingest_rate = ingest / (perf_counter() - started)
+    batches = [
+        [signed_transaction(secret_key, public_key, keys[1 + i % 9][1], 0.001, 0.0001, 1996793687.5 + i)
+         for i in range(start, min(start + 100, ingest))]
+        for start in range(0, ingest, 100)
+    ]
+    started = perf_counter()
+    asyncio.run(_post_batches(target_app, batches))
+    batch_rate = ingest / (perf_counter() - started)
+
+    transports = {'http://source': httpx.ASGITransport(app=source_app)}
+    syncing, _ = bench_node('sync', nodes=['http://source'], transports=transports)
+    sync = asyncio.run(_sync(syncing))
+    assert syncing.last_block['index'] == source.last_block['index']
+    for blockchain in (source, target, syncing):
+        blockchain.miner.close()
+
+    result = {
+        'blocks': len(chain),
+        'transactions_per_block': transactions,
+        'generate_seconds': generated,
+        'validate_chain_seconds': validate,
+        'block_get': _summary(block_timings),
+        'transactions_get_per_second': ingest_rate,
+        'transactions_batch_per_second': batch_rate,
+        'sync_seconds': sync,
+    }
+    print(f'end to end blocks={result["blocks"]} transactions={transactions}')
+    print(f'  validate_chain:      {validate:.2f} s')
+    print(f'  /block/get:          {result["block_get"]["p50_ms"]:.1f} ms p50, {result["block_get"]["p95_ms"]:.1f} ms p95')
+    print(f'  /transactions/get:   {ingest_rate:,.0f} tx/s')
+    print(f'  /transactions/batch: {batch_rate:,.0f} tx/s')
+    print(f'  sync two nodes:      {sync:.2f} s')
+    return result
+
+
+async def _post(app, path: str, body: dict) -> float:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://node') as client:
+        started = perf_counter()
+        response = await client.post(path, json=body)
+        assert response.json() is True, response.text
+        return perf_counter() - started
+
+
+def bench_compact(transactions: int = 1000) -> dict:
+    """Full and compact relay of one block whose transactions are already in the receiver's mempool"""
+    keys = [new_keys() for _ in range(10)]
+    source, _ = bench_node('source')
+    mine_block(source, *keys[0])
+    pending = [
+        signed_transaction(keys[0][0], keys[0][1], keys[1 + i % 9][1], 0.001, 0.0001, 1696793687.5 + i)
+        for i in range(transactions)
+    ]
+    targets = []
+    for name in ('cold', 'full', 'compact'):
+        target, app = bench_node(name)
+        target.append_blocks(list(source.blocks(2, 1)))
+        if name != 'cold':
+            target.add_transactions(pending)
+        targets.append((target, app))
+    source.add_transactions(pending)
+    block = mine_block(source, *keys[0])
+    compact = compact_block(block, [len(block['transactions']) - 1])
+    cold_seconds = asyncio.run(_post(targets[0][1], '/block/get', block))
+    full_seconds = asyncio.run(_post(targets[1][1], '/block/get', block))
+    compact_seconds = asyncio.run(_post(targets[2][1], '/block/compact', compact))
+    for blockchain in [source] + [target for target, _ in targets]:
+        blockchain.miner.close()
+    result = {
+        'transactions': len(block['transactions']),
+        'full_bytes': len(json.dumps(block)),
+        'compact_bytes': len(json.dumps(compact)),
+        'cold_seconds': cold_seconds,
+        'full_seconds': full_seconds,
+        'compact_seconds': compact_seconds,
+    }
+    print(f'block relay transactions={result["transactions"]}')
+    print(f'  full, empty mempool: {result["full_bytes"]:,} bytes, {cold_seconds * 1000:.1f} ms')
+    print(f'  full:                {result["full_bytes"]:,} bytes, {full_seconds * 1000:.1f} ms')
+    print(f'  compact:             {result["compact_bytes"]:,} bytes, {compact_seconds * 1000:.1f} ms')
+    return result
+
+
+def _flatten(result: dict, prefix: str = '') -> dict:
+    values = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            values.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            values[prefix + key] = value
+    return values
+
+
+STARTUP_TARGETS = {'wallet': 0.5, 'node': 2.0}
+_STARTUP_SCRIPTS = {
+    'wallet': 'import wallet',
+    'node': """
+import asyncio, httpx, api
+async def main():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url='http://node') as client:
+        assert (await client.get('/chain/height')).json() >= 1
+asyncio.run(main())
+""",
+}
+
+
+def bench_startup(rounds: int = 5) -> dict:
+    """Wall time of a fresh interpreter importing the wallet, and of a node answering its first request"""
+    result = {}
+    print(f'cold start rounds={rounds}')
+    for name, script in _STARTUP_SCRIPTS.items():
+        timings = []
+        for _ in range(rounds):
+            with tempfile.TemporaryDirectory() as path:
+                env = dict(os.environ, STORAGE='file', DATA_DIR=path)
+                started = perf_counter()
+                subprocess.run([sys.executable, '-c', script], check=True, env=env,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+                timings.append(perf_counter() - started)
+        result[name] = _summary(timings)
+        target = STARTUP_TARGETS[name]
+        p50 = result[name]['p50_ms'] / 1000
+        print(f'  {name:<7} {p50:.3f} s p50, target {target:.1f} s {"ok" if p50 <= target else "MISSED"}')
+    return result
+
+
+def compare(old_path: str, new_path: str):
+    """Print ratio new / old of every number in two result files"""
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    print(f'{old.get("commit", old_path)} -> {new.get("commit", new_path)}')
+    old_values = _flatten(old['results'])
+    for key, value in _flatten(new['results']).items():
+        if key in old_values:
+            ratio = value / old_values[key] if old_values[key] else float('inf')
+            print(f'  {key:<50} {old_values[key]:>14.4f} {value:>14.4f}  x{ratio:.2f}')
+
+
+def write_results(path: str, results: dict):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    with open(path, 'w') as file:
+        json.dump({
+            'commit': commit,
+            'timestamp': time(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'results': results
+        }, file, indent=2)
+
+
+BENCHMARKS = {
+    'pow': bench_proof_of_work,
+    'validate_chain': bench_validate_chain,
+    'signatures': bench_signatures,
+    'propagation': bench_propagation,
+    'api_load': bench_api_load,
+    'encoding': bench_encoding,
+    'storage': bench_storage,
+    'history': bench_history,
+    'e2e': bench_e2e,
+    'compact': bench_compact,
+    'startup': bench_startup,
+}
+
+
+if __name__ == '__main__':
+    # benchmark.py [name[=arg,arg]...] [--out=results.json] | benchmark.py compare old.json new.json
+    if sys.argv[1:2] == ['compare']:
+        compare(*sys.argv[2:4])
+        sys.exit()
+    out = None
+    names = []
+    for arg in sys.argv[1:]:
+        if arg.startswith('--out='):
+            out = arg.partition('=')[2]
+        else:
+            names.append(arg)
+    results = {}
+    for name in names or list(BENCHMARKS):
+        name, _, args = name.partition('=')
+        result = BENCHMARKS[name](*map(int, filter(None, args.split(','))))
+        if result is not None:
+            results[name] = result
+    if out:
+        write_results(out, results)
@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+from blockchain_utils import block_hash
+
+RECENT_BLOCKS = 2048
+
+
+class BlockCache:
+    """Chain tip and LRU of recent blocks with their hashes, size=0 disables it"""
+
+    def __init__(self, size: int = RECENT_BLOCKS):
+        self.size = size
+        self.tip = None
+        self._blocks = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, index: int) -> dict | None:
+        with self._lock:
+            entry = self._blocks.get(index)
+            if entry is None:
+                return None
+            self._blocks.move_to_end(index)
+            return entry[0]
+
+    def hash(self, block: dict) -> str:
+        """Hash of a stored block, its own stored hash is trusted"""
+        with self._lock:
+            entry = self._blocks.get(block['index'])
+            if entry is not None and entry[0] is block:
+                return entry[1]
+            return block.get('hash') or block_hash(block)
+
+    def put(self, block: dict):
+        with self._lock:
+            if not self.size:
+                return
+            self._blocks[block['index']] = (block, block.get('hash') or block_hash(block))
+            self._blocks.move_to_end(block['index'])
+            while len(self._blocks) > self.size:
+                self._blocks.popitem(last=False)
+
+    def push(self, block: dict):
+        """Block appended on top of the chain, the tip is only lowered by truncate"""
+        with self._lock:
+            self.put(block)
+            if self.size and (self.tip is None or block['index'] >= self.tip['index']):
+                self.tip = block
+
+    def truncate(self, index: int):
+        """Blocks above index were removed"""
+        with self._lock:
+            for key in [key for key in self._blocks if key > index]:
+                del self._blocks[key]
+            self.tip = None
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self.tip = None
@@ -1,237 +1,619 @@
-import hashlib
+import asyncio
+import struct
+import threading
+from collections import ChainMap
+from functools import wraps
 from time import time
-import pymongo
-import requests
-from blockchain_utils import elem_hash
-from keygen import sign_ecdsa_msg, validate_signature
-from config import PUBLIC_KEY, SECRET_KEY, NODES
-from mongo_db import Mongo
+from block_cache import BlockCache
+from blockchain_utils import VERSION, block_hash, create_transaction, merkle_root, transaction_hash
+from mempool import Mempool
+from metrics import metrics
+from keygen import validate_signature, validate_signatures
+from config import (
+    PUBLIC_KEY, SECRET_KEY, NODES, MINER_WORKERS, VERIFY_WORKERS, SYNC_WINDOW, STORAGE, DATA_DIR, ACTIVATION_HEIGHT
+)
+from miner import ParallelMiner, check_proof
+from mining import MiningService
+from peers import PeerClient
+from schedule import Schedule
+from sync import BlockSync
+from storage import Storage, open_storage
+from state import StateStore
+
+VALIDATE_BATCH = 1000
+BLOCK_TRANSACTIONS = 1000
+
+
+def locked(method):
+    """Run method holding blockchain lock, chain, state and mempool have one writer at a time"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class lazy:
+    """Attribute built by the decorated method on first access under blockchain lock, assignment replaces it"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.name = factory.__name__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        with instance.lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.factory(instance)
+        return instance.__dict__[self.name]
 
 
 class Blockchain:
-    def __init__(self):
-        self.difficult = 8
-        self.reward = 50
+    """Storage, state and schedule are opened on first use, constructing a node doesn't touch the database"""
+
+    def __init__(self, db: Storage = None):
         self.one_unit = 0.00000001
         self.emission_address = '0'
-        self.current_transactions = []
-        self.current_transactions_hashes = set()
-        self.nodes = set()
-        self.wallets = {}
-        self.db = Mongo()
-        for node in NODES:
-            self.nodes.add(node)
-
-    def mine(self):
-        self.validate_chain()
-        self.consensus()
-        for node in NODES:
-            response = requests.get(node + '/transactions/existing')
-            if response.status_code == 200:
-                transactions = response.json()
-                for transaction in transactions:
-                    if transaction['hash'] not in self.current_transactions_hashes:
-                        if self.validate_transaction(transaction):
-                            self.current_transactions.append(transaction)
-                            self.current_transactions_hashes.add(transaction['hash'])
+        self.mempool = Mempool()
+        self.lock = threading.RLock()
+        if db is not None:
+            self.db = db
+        self.cache = BlockCache()
+        self.miner = ParallelMiner(MINER_WORKERS)
+        self.peers = PeerClient(NODES)
+        self.sync = BlockSync(self, SYNC_WINDOW)
+        self.mining = MiningService(self)
+
+    @lazy
+    def db(self) -> Storage:
+        return open_storage(STORAGE, DATA_DIR)
+
+    @lazy
+    def state(self) -> StateStore:
+        return StateStore(self.db)
+
+    @lazy
+    def schedule(self) -> Schedule:
+        return Schedule(self.db, activation=ACTIVATION_HEIGHT)
+
+    async def mine(self):
+        """Mine one block on the current tip, return None if the tip changed during the search"""
+        await asyncio.to_thread(self.validate_chain)
+        await self.consensus()
+        transactions = await self.peers.mempool(BLOCK_TRANSACTIONS)
+        if transactions:
+            await asyncio.to_thread(self.add_transactions, transactions)
+        self.miner.reset()
         last_block = self.last_block
-        last_proof = last_block['proof']
-        proof = self.proof_of_work(last_proof)
-        self.new_transaction(
+        previous_hash = self.cache.hash(last_block)
+        proof = await asyncio.to_thread(self.proof_of_work, last_block['proof'], False)
+        if proof is None:
+            return None
+        block = await asyncio.to_thread(self.seal_block, proof, previous_hash)
+        if block is not None:
+            await self.peers.broadcast_block(block)
+        return block
+
+    @locked
+    def seal_block(self, proof: int, previous_hash: str) -> dict | None:
+        """New block with proof found on top of previous_hash, None if the tip has changed since"""
+        if self.cache.hash(self.last_block) != previous_hash:
+            return None
+        emission = self.create_transaction(
             sender=self.emission_address,
             recipient=PUBLIC_KEY,
             amount=self.reward,
             fee=0,
             secret_key=SECRET_KEY
         )
-        previous_hash = elem_hash(last_block)
-        block = self.new_block(proof, previous_hash)
-        for node in self.nodes:
-            requests.post(node + '/block/get', json=block)
-        return block
+        return self.new_block(proof, previous_hash, emission)
 
-    def new_block(self, proof: int, previous_hash=None) -> dict:
+    @locked
+    def new_block(self, proof: int, previous_hash=None, emission: dict = None) -> dict:
         last_block = self.last_block
+        transactions, balances = self.block_template(emission)
         block = {
+            'version': VERSION,
             'index': last_block['index'] + 1,
-            'timestamp': time(),
-            'transactions': self.current_transactions,
+            'timestamp': max(time(), last_block['timestamp']),
+            'transactions': transactions,
             'proof': proof,
-            'previous_hash': previous_hash or elem_hash(last_block),
+            'previous_hash': previous_hash or self.cache.hash(last_block),
             'difficult': self.difficult,
-            'reward': self.reward
+            'reward': self.reward,
+            'merkle_root': merkle_root([trn['hash'] for trn in transactions])
         }
-        self.current_transactions = []
-        self.current_transactions_hashes = set()
-        self.db.block_collection.insert_one(block)
-        del block['_id']
+        block['hash'] = block_hash(block)
+        self.db.append_batch([block])
+        self.cache.push(block)
+        self.state.apply_block(block, balances)
+        self.refresh_mempool([block])
         return block
 
+    @locked
+    def block_template(self, emission: dict = None) -> tuple[list[dict], dict]:
+        """Best paying mempool transactions valid on top of state and their balance changes"""
+        wallets = ChainMap({}, self.state.balances)
+        reward = self.reward
+        transactions = []
+        for transaction in self.mempool.select(BLOCK_TRANSACTIONS):
+            if transaction.get('version', 1) < VERSION:
+                continue
+            if self.validate_transaction(transaction, wallets, signed=True):
+                transactions.append(transaction)
+        if emission and self.validate_transaction(emission, wallets, reward=reward):
+            transactions.append(emission)
+        return transactions, wallets.maps[0]
+
+    @locked
+    def append_blocks(self, blocks: list[dict]) -> bool:
+        """Validate blocks on top of the tip, store the valid prefix and apply it to state"""
+        last_block = self.last_block
+        previous_hash = self.cache.hash(last_block)
+        batch_balances = ChainMap({}, self.state.balances)
+        epochs = self.schedule.view(last_block['index'])
+        batch = []
+        valid = True
+        for block in blocks:
+            balances = batch_balances.new_child()
+            if not self.validate_block(block, last_block, balances, previous_hash, epochs):
+                valid = False
+                break
+            batch.append((block, balances.maps[0]))
+            batch_balances.maps[0].update(balances.maps[0])
+            last_block = block
+            previous_hash = block['hash']
+        if batch:
+            with metrics.spent('block_validation_stage_seconds_total', stage='storage'):
+                self.db.append_batch([block for block, _ in batch])
+                for block, _ in batch:
+                    self.cache.push(block)
+                self.state.apply_blocks(batch)
+            self.schedule.commit(epochs, last_block['index'])
+            self.refresh_mempool([block for block, _ in batch])
+            self.miner.stop()
+        return valid
+
+    @locked
+    def rollback(self, index: int):
+        """Drop blocks above index, their transactions go back to mempool"""
+        removed = [
+            transaction
+            for block in self.blocks(index + 1, self.last_block['index'] - index)
+            for transaction in block['transactions']
+            if transaction['sender'] != self.emission_address
+        ]
+        if self.state.can_rollback(index):
+            self.state.rollback(index)
+        else:
+            self.state.reset()
+        self.db.truncate_from(index + 1)
+        self.cache.truncate(index)
+        self.schedule.truncate(index)
+        self.miner.stop()
+        self.validate_chain()
+        if removed:
+            self.add_transactions(removed)
+
+    def refresh_mempool(self, blocks: list[dict]):
+        """Drop confirmed transactions and those senders can't pay for anymore"""
+        senders = set()
+        for block in blocks:
+            for transaction in block['transactions']:
+                self.mempool.remove(transaction['hash'])
+                senders.add(transaction['sender'])
+        for sender in senders:
+            pending = sorted(self.mempool.by_sender(sender), key=lambda trn: trn['fee'])
+            spend = sum(trn['amount'] + trn['fee'] for trn in pending)
+            while pending and spend > self.state.get(sender):
+                transaction = pending.pop(0)
+                self.mempool.remove(transaction['hash'])
+                spend -= transaction['amount'] + transaction['fee']
+
+    def add_transaction(self, transaction: dict) -> bool:
+        """Put valid transaction to mempool, sender has to cover all of its pending transactions.
+
+        Hash and signature are checked before taking the lock, so concurrent submissions verify in parallel.
+        """
+        if not self._admissible(transaction) or not validate_signature(public_key=transaction['sender'],
+                                                                       signature=transaction['sign'],
+                                                                       message=transaction['hash']):
+            return False
+        return self.add_verified_transaction(transaction)
+
+    def add_transactions(self, transactions: list[dict]) -> list[bool]:
+        """add_transaction for a batch, signatures are verified in bulk and a malformed transaction
+        only gets False as its own status"""
+        candidates = [self._admissible(transaction) for transaction in transactions]
+        signatures = validate_signatures(
+            [(trn['sender'], trn['sign'], trn['hash']) for trn, ok in zip(transactions, candidates) if ok],
+            VERIFY_WORKERS
+        )
+        signatures = iter(signatures)
+        with self.lock:
+            return [
+                ok and next(signatures) and self.add_verified_transaction(transaction)
+                for transaction, ok in zip(transactions, candidates)
+            ]
+
+    def _admissible(self, transaction: dict) -> bool:
+        """Checks of add_transaction before its signature, version 1 transactions can't be mined anymore"""
+        try:
+            return (
+                transaction.get('version', 1) >= VERSION
+                and transaction['sender'] != self.emission_address
+                and not self.known_transaction(transaction['hash'])
+                and self.validate_hash(transaction)
+            )
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    def reconstruct_block(self, compact: dict) -> tuple[dict | None, list[int]]:
+        """Block from compact form and mempool, or None and positions of transactions to be sent in full"""
+        prefilled = {position: transaction for position, transaction in compact.get('prefilled', [])}
+        known = self.mempool.short_ids()
+        transactions = []
+        missing = []
+        for position, value in enumerate(compact['short_ids']):
+            transaction = prefilled.get(position) or known.get(value)
+            if transaction is None:
+                missing.append(position)
+            transactions.append(transaction)
+        if not missing:
+            block = {key: value for key, value in compact.items() if key not in ('short_ids', 'prefilled')}
+            block['transactions'] = transactions
+            try:
+                if merkle_root([trn['hash'] for trn in transactions]) == block['merkle_root']:
+                    return block, []
+            except (KeyError, TypeError, ValueError):
+                pass
+            missing = [position for position in range(len(transactions)) if position not in prefilled]
+        return None, missing
+
+    def known_transaction(self, transaction_hash: str) -> bool:
+        """Transaction is pending or confirmed"""
+        return transaction_hash in self.mempool or self.db.transaction_location(transaction_hash) is not None
+
+    @locked
+    def add_verified_transaction(self, transaction: dict) -> bool:
+        if transaction['hash'] in self.mempool:
+            return False
+        wallets = ChainMap({}, self.state.balances)
+        if transaction['sender'] in wallets:
+            wallets[transaction['sender']] -= self.mempool.pending_spend(transaction['sender'])
+        if not self.validate_transaction(transaction, wallets, signed=True):
+            return False
+        return self.mempool.add(transaction)
+
     def new_transaction(
             self, sender: str,
             recipient: str,
             amount: float,
             fee: float,
             secret_key: str) -> dict:
-        transaction = {
-            'sender': sender,
-            'recipient': recipient,
-            'amount': amount,
-            'timestamp': time(),
-            'fee': fee
-        }
-        transaction['hash'] = elem_hash(transaction)
-        transaction["sign"] = sign_ecdsa_msg(secret_key, transaction['hash'])
-        if self.validate_transaction(transaction):
-            self.current_transactions.append(transaction)
-            self.current_transactions_hashes.add(transaction['hash'])
+        transaction = self.create_transaction(sender, recipient, amount, fee, secret_key)
+        self.add_transaction(transaction)
         return transaction
 
+    def create_transaction(
+            self, sender: str,
+            recipient: str,
+            amount: float,
+            fee: float,
+            secret_key: str) -> dict:
+        """Signed transaction which is not added to mempool"""
+        return create_transaction(sender, recipient, amount, fee, secret_key)
+
     @property
     def last_block(self):
-        block = self.db.block_collection.find_one(sort=[('index', pymongo.DESCENDING)])
-        del block['_id']
-        return block
+        """Cached tip, callers must not modify it. It is loaded under the lock, so a writer can't
+        store newer blocks between reading the stored tip and caching it"""
+        tip = self.cache.tip
+        if tip is not None:
+            return tip
+        with self.lock:
+            tip = self.cache.tip
+            if tip is None:
+                tip = self.db.tip()
+                self.cache.push(tip)
+            return tip
 
     def block_by_index(self, index):
-        block = self.db.block_collection.find_one({'index': index})
-        del block['_id']
+        block = self.cache.get(index)
+        if block is None:
+            block = self.db.get_by_index(index)
+            self.cache.put(block)
         return block
 
-    def proof_of_work(self, last_proof: int) -> int:
-        proof = 0
-        while self.validate_proof(last_proof, proof) is False:
-            proof += 1
-        return proof
+    def blocks(self, start: int, length: int) -> list[dict]:
+        """Blocks with index in [start, start + length), from cache if all of them are there"""
+        end = min(start + length, self.last_block['index'] + 1)
+        cached = [self.cache.get(index) for index in range(start, end)]
+        if cached and all(cached):
+            return cached
+        blocks = list(self.db.range(start, start + length))
+        for block in blocks:
+            self.cache.put(block)
+        return blocks
 
-    def check_balance(self, public_key: str) -> float:
-        try:
-            return self.wallets[public_key]
-        except KeyError:
-            return 0
+    def transaction_by_hash(self, transaction_hash: str) -> dict | None:
+        """Confirmed transaction with its location, or pending one from mempool with block None"""
+        location = self.db.transaction_location(transaction_hash)
+        if location is not None:
+            index, position = location
+            if index <= self.last_block['index']:
+                block = self.block_by_index(index)
+                transactions = block['transactions']
+                if position < len(transactions) and transactions[position]['hash'] == transaction_hash:
+                    return {
+                        'block': index,
+                        'position': position,
+                        'confirmations': self.last_block['index'] - index + 1,
+                        'transaction': transactions[position]
+                    }
+        transaction = self.mempool.get(transaction_hash)
+        if transaction is None:
+            return None
+        return {'block': None, 'position': None, 'confirmations': 0, 'transaction': transaction}
 
-    def consensus(self) -> bool:
-        """Return True if chain was replaced"""
+    def address_history(self, public_key: str, offset: int = 0, limit: int = 100) -> list[dict]:
+        """Confirmed transactions sent or received by public_key, newest first"""
+        if limit <= 0:
+            return []
         height = self.last_block['index']
-        max_height = height
-        nodes_heights = {}
-        for node in self.nodes:
-            response = requests.get(node + '/chain/height')
-            if response.status_code == 200 and response.json() > height:
-                nodes_heights[node] = response.json()
-                max_height = response.json()
-        if len(nodes_heights) == 0:
-            return False
-        max_node = max(nodes_heights, key=nodes_heights.get)
-        nums_of_req = 1
-        additional_chain = []
-        req_start = height
-        if max_height - height > 10:
-            nums_of_req = ((max_height - height) // 10) + 1
-        for i in range(nums_of_req):
-            resp = requests.get(max_node + f'/get_blocks?start={req_start}&length={11}')
-            if resp.status_code == 200:
-                additional_chain.extend(resp.json())
-                req_start += 10
-            else:
-                return False
-        if self.validate_chain(additional_chain):
-            self.db.block_collection.insert_many(additional_chain)
+        history = []
+        for index, position, stored_hash in self.db.address_history(public_key, offset, limit):
+            if index > height:
+                continue
+            transactions = self.block_by_index(index)['transactions']
+            if position < len(transactions) and transactions[position]['hash'] == stored_hash:
+                history.append({'block': index, 'position': position, 'transaction': transactions[position]})
+        return history
+
+    def proof_of_work(self, last_proof: int, reset: bool = True) -> int | None:
+        """Return None if search was interrupted by miner.stop(), which is called on every new tip"""
+        return self.miner.search(last_proof, self.difficult, reset=reset)
+
+    @property
+    def difficult(self) -> int:
+        """Difficulty of the next block"""
+        return self.schedule.difficult(self.last_block)
+
+    @property
+    def reward(self) -> float:
+        """Reward of the next block"""
+        return self.schedule.reward(self.last_block['index'] + 1)
+
+    def check_balance(self, public_key: str) -> float:
+        return self.state.get(public_key)
+
+    async def consensus(self) -> bool:
+        """Return True if chain was extended or replaced"""
+        return await self.sync.run()
+
+    def signer(self, transaction: dict) -> str:
+        if transaction['sender'] == self.emission_address:
+            return transaction['recipient']
+        return transaction['sender']
+
+    def validate_hash(self, transaction: dict) -> bool:
+        """Version 2 hash binds amounts to the signature, older transactions keep their hash as is"""
+        if transaction.get('version', 1) < VERSION:
             return True
-        return False
+        try:
+            return transaction_hash(transaction) == transaction['hash']
+        except (KeyError, TypeError, ValueError, struct.error):
+            return False
 
-    def validate_transaction(self, transaction: dict) -> bool:
-        transaction_without_sign = dict(transaction)
-        transaction_without_sign.pop('sign')
+    def validate_transaction(
+            self, transaction: dict,
+            wallets: ChainMap = None,
+            signed: bool = False,
+            reward: float = None) -> bool:
+        """Apply transaction to wallets (scratch copy of state by default) if it is valid,
+        signed=True skips signature check for already verified transactions,
+        reward is the one of the block emission goes to, next block by default"""
+        if wallets is None:
+            wallets = ChainMap({}, self.state.balances)
+        if reward is None:
+            reward = self.reward
+        if not signed and not self.validate_hash(transaction):
+            return False
         if transaction['sender'] == self.emission_address:
-            if transaction['amount'] > self.reward:
+            if transaction['amount'] > reward:
                 return False
-            if not validate_signature(public_key=transaction['recipient'], signature=transaction['sign'],
-                                      message=transaction['hash']):
+            if not signed and not validate_signature(public_key=transaction['recipient'],
+                                                     signature=transaction['sign'],
+                                                     message=transaction['hash']):
                 return False
-            if transaction['recipient'] not in self.wallets:
-                self.wallets[transaction['recipient']] = self.reward
+            if transaction['recipient'] not in wallets:
+                wallets[transaction['recipient']] = reward
             else:
-                self.wallets[transaction['recipient']] += self.reward
+                wallets[transaction['recipient']] += reward
             return True
         else:
-            if transaction['sender'] not in self.wallets or transaction['fee'] < self.one_unit:
+            if transaction['sender'] not in wallets or transaction['fee'] < self.one_unit:
                 return False
-            if self.wallets[transaction['sender']] < transaction['amount'] + transaction['fee']:
+            if wallets[transaction['sender']] < transaction['amount'] + transaction['fee']:
                 return False
-            if not validate_signature(public_key=transaction['sender'], signature=transaction['sign'],
-                                      message=transaction['hash']):
+            if not signed and not validate_signature(public_key=transaction['sender'],
+                                                     signature=transaction['sign'],
+                                                     message=transaction['hash']):
                 return False
-            self.wallets[transaction['sender']] -= transaction['amount'] + transaction['fee']
-            if transaction['recipient'] not in self.wallets:
-                self.wallets[transaction['recipient']] = transaction['amount']
+            wallets[transaction['sender']] -= transaction['amount'] + transaction['fee']
+            if transaction['recipient'] not in wallets:
+                wallets[transaction['recipient']] = transaction['amount']
             else:
-                self.wallets[transaction['recipient']] += transaction['amount']
+                wallets[transaction['recipient']] += transaction['amount']
             return True
 
-    def validate_transactions(self, transactions: list[dict]) -> bool:
-        emission_transaction = 0
-        transactions_hashes = []
-        for transaction in transactions:
-            if emission_transaction > 1:
-                return False
-            if transaction['sender'] == self.emission_address:
-                emission_transaction += 1
-            if transaction['hash'] in transactions_hashes:
-                return False
-            if not self.validate_transaction(transaction):
+    def validate_transactions(self, transactions: list[dict], wallets: ChainMap, reward: float = None) -> bool:
+        """Hash and signature of transactions identical to mempool ones were checked when they were added,
+        wallets are changed only if all transactions are valid, malformed ones are invalid"""
+        try:
+            unverified = [trn for trn in transactions if self.mempool.get(trn['hash']) != trn]
+            with metrics.spent('block_validation_stage_seconds_total', stage='hash'):
+                if not all(self.validate_hash(transaction) for transaction in unverified):
+                    return False
+            with metrics.spent('block_validation_stage_seconds_total', stage='signatures'):
+                signatures = validate_signatures(
+                    [(self.signer(trn), trn['sign'], trn['hash']) for trn in unverified],
+                    VERIFY_WORKERS
+                )
+            if not all(signatures):
                 return False
-            transactions_hashes.append(transaction['hash'])
+            emission_transaction = 0
+            transactions_hashes = []
+            changes = wallets.new_child()
+            for transaction in transactions:
+                if emission_transaction > 1:
+                    return False
+                if transaction['sender'] == self.emission_address:
+                    emission_transaction += 1
+                if transaction['hash'] in transactions_hashes:
+                    return False
+                if not self.validate_transaction(transaction, changes, signed=True, reward=reward):
+                    return False
+                transactions_hashes.append(transaction['hash'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        wallets.update(changes.maps[0])
         return True
 
-    def validate_block(self, block: dict, previous_block: dict) -> bool:
-        if block['previous_hash'] != elem_hash(previous_block):
-            return False
-        if not self.validate_proof(previous_block['proof'], block['proof']):
+    def validate_block(
+            self, block: dict,
+            previous_block: dict,
+            wallets: ChainMap = None,
+            previous_hash: str = None,
+            epochs: ChainMap = None) -> bool:
+        """Balance changes are written to wallets and schedule epochs to epochs,
+        scratch copies of state and schedule are used by default"""
+        with metrics.timer('block_validation_seconds'):
+            return self._validate_block(block, previous_block, wallets, previous_hash, epochs)
+
+    def _validate_block(
+            self, block: dict,
+            previous_block: dict,
+            wallets: ChainMap,
+            previous_hash: str,
+            epochs: ChainMap) -> bool:
+        if wallets is None:
+            wallets = ChainMap({}, self.state.balances)
+        if epochs is None:
+            epochs = self.schedule.view(previous_block['index'])
+        if block['previous_hash'] != (previous_hash or self.cache.hash(previous_block)):
             return False
         if (block['index'] - 1) != previous_block['index']:
             return False
-        if block['reward'] != self.reward or block['difficult'] != self.difficult:
+        if not self.schedule.valid_timestamp(block, previous_block):
+            return False
+        if not self.schedule.check(block, previous_block, epochs):
             return False
-        sum_of_fee = 0
-        for trn in block['transactions']:
-            sum_of_fee += trn['fee']
-        if not self.validate_transactions(block['transactions']):
+        if not self.validate_proof(previous_block['proof'], block['proof'], block['difficult']):
+            return False
+        if block.get('version', 1) >= VERSION:
+            if any(trn.get('version', 1) < VERSION for trn in block['transactions']):
+                return False
+            try:
+                with metrics.spent('block_validation_stage_seconds_total', stage='hash'):
+                    root = merkle_root([trn['hash'] for trn in block['transactions']])
+            except (KeyError, TypeError, ValueError):
+                return False
+            if block.get('merkle_root') != root:
+                return False
+        if not self.validate_transactions(block['transactions'], wallets, block['reward']):
+            return False
+        try:
+            with metrics.spent('block_validation_stage_seconds_total', stage='hash'):
+                computed = block_hash(block)
+        except (KeyError, TypeError, ValueError, struct.error):
+            return False
+        if block.setdefault('hash', computed) != computed:
             return False
         return True
 
-    def validate_proof(self, last_proof: int, proof: int) -> bool:
-        guess = f'{last_proof}{proof}'.encode()
-        guess_hash = hashlib.sha256(guess).hexdigest()
-        if guess_hash[:self.difficult] == '0' * self.difficult:
-            print(guess_hash)
-            return True
-        return False
+    def validate_headers(self, headers: list[dict], previous_block: dict, epochs: ChainMap = None) -> int:
+        """Number of leading headers which link into a valid proof of work chain, their hashes are stored in them.
+        Headers following already checked ones are validated with the same epochs"""
+        previous_hash = self.cache.hash(previous_block)
+        if epochs is None:
+            epochs = self.schedule.view(previous_block['index'])
+        for count, header in enumerate(headers):
+            if header['index'] != previous_block['index'] + 1 or header['previous_hash'] != previous_hash:
+                return count
+            if not self.schedule.valid_timestamp(header, previous_block):
+                return count
+            if not self.schedule.check(header, previous_block, epochs):
+                return count
+            if not self.validate_proof(previous_block['proof'], header['proof'], header['difficult']):
+                return count
+            try:
+                previous_hash = header['hash'] = block_hash(header)
+            except (KeyError, TypeError, ValueError, struct.error):
+                return count
+            previous_block = header
+        return len(headers)
+
+    def validate_proof(self, last_proof: int, proof: int, difficult: int = None) -> bool:
+        """Proof of the next block by default"""
+        return check_proof(last_proof, proof, difficult or self.difficult)
 
+    @locked
     def validate_chain(self, chain: list[dict] = None) -> bool:
+        """Without chain validate stored blocks above state height (the validated watermark)
+        in one sorted cursor, invalid block and everything above it is deleted"""
         if not chain:
             last_index = self.last_block['index']
-            last_block = self.db.block_collection.find_one({'index': 1})
-            del last_block['_id']
-            current_index = 2
-            while current_index <= last_index:
-                block = self.db.block_collection.find_one({'index': current_index})
-                if not block:
-                    self.db.block_collection.delete_many({'index': {'$gt': 1}})
-                    return False
-                del block['_id']
-                if not self.validate_block(block, last_block):
-                    self.db.block_collection.delete_many({'index': {'$gt': block['index']}})
-                    return block['index']
+            if self.state.height > last_index:
+                if self.state.can_rollback(last_index):
+                    self.state.rollback(last_index)
+                else:
+                    self.state.reset()
+            last_block = self.block_by_index(self.state.height)
+            previous_hash = self.cache.hash(last_block)
+            current_index = self.state.height + 1
+            cursor = self.db.range(self.state.height + 1)
+            batch_balances = ChainMap({}, self.state.balances)
+            epochs = self.schedule.view(self.state.height)
+            batch = []
+            result = True
+            for block in cursor:
+                if block['index'] != current_index:
+                    result = False
+                    break
+                balances = batch_balances.new_child()
+                if not self.validate_block(block, last_block, balances, previous_hash, epochs):
+                    result = block['index']
+                    break
+                batch.append((block, balances.maps[0]))
+                batch_balances.maps[0].update(balances.maps[0])
+                if len(batch) >= VALIDATE_BATCH:
+                    with metrics.spent('block_validation_stage_seconds_total', stage='storage'):
+                        self.state.apply_blocks(batch)
+                    batch = []
+                    batch_balances = ChainMap({}, self.state.balances)
                 last_block = block
+                previous_hash = block['hash']
                 current_index += 1
-            return True
+            cursor.close()
+            with metrics.spent('block_validation_stage_seconds_total', stage='storage'):
+                self.state.apply_blocks(batch)
+            self.schedule.commit(epochs, current_index - 1)
+            if result is not True:
+                self.db.truncate_from(current_index)
+                self.cache.truncate(current_index - 1)
+                self.schedule.truncate(current_index - 1)
+            return result
         else:
             last_block = chain[0]
+            balances = ChainMap({}, self.state.balances)
+            epochs = self.schedule.view(last_block['index'])
             current_index = 1
             while current_index < len(chain):
-                block = chain[1]
-                if not self.validate_block(block, last_block):
+                block = chain[current_index]
+                balances = balances.new_child()
+                if not self.validate_block(block, last_block, balances, epochs=epochs):
                     return block['index']
                 last_block = block
                 current_index += 1
@@ -1,7 +1,145 @@
+import base64
 import hashlib
 import json
+import struct
+from time import time
+from keygen import sign_ecdsa_msg
+
+UNIT = 10 ** 8
+VERSION = 2
+EMISSION_ADDRESS = '0'
+
+_TRANSACTION = struct.Struct('>BB64s64sQQd')
+_HEADER = struct.Struct('>BQdQ32sBQ32s')
+SHORT_ID_LENGTH = 8
 
 
 def elem_hash(elem: dict) -> str:
     block_string = json.dumps(elem, sort_keys=True).encode()
     return hashlib.sha256(block_string).hexdigest()
+
+
+def to_units(amount: float) -> int:
+    """Amounts finer than 10^-8 are rejected, otherwise several amounts would share one hash"""
+    units = round(amount * UNIT)
+    if units / UNIT != amount:
+        raise ValueError(f'{amount} is not a whole number of 10^-8 units')
+    return units
+
+
+def encode_transaction(transaction: dict) -> bytes:
+    """Binary form of a version 2 transaction without its hash and sign, which is what gets hashed.
+
+    Keys are raw bytes, amounts are integers of 10^-8 coins.
+    """
+    emission = transaction['sender'] == EMISSION_ADDRESS
+    return _TRANSACTION.pack(
+        transaction['version'],
+        0 if emission else 1,
+        b'' if emission else base64.b64decode(transaction['sender']),
+        base64.b64decode(transaction['recipient']),
+        to_units(transaction['amount']),
+        to_units(transaction['fee']),
+        transaction['timestamp']
+    )
+
+
+def transaction_hash(transaction: dict) -> str:
+    """Version 2 hashes binary form, older transactions hash their JSON fields"""
+    if transaction.get('version', 1) >= VERSION:
+        return hashlib.sha256(encode_transaction(transaction)).hexdigest()
+    fields = ('sender', 'recipient', 'amount', 'timestamp', 'fee')
+    return elem_hash({key: transaction[key] for key in fields})
+
+
+def create_transaction(sender: str, recipient: str, amount: float, fee: float, secret_key: str) -> dict:
+    """Signed version 2 transaction, amount and fee are rounded to whole 10^-8 units"""
+    transaction = {
+        'version': VERSION,
+        'sender': sender,
+        'recipient': recipient,
+        'amount': round(amount, 8),
+        'timestamp': time(),
+        'fee': round(fee, 8)
+    }
+    transaction['hash'] = transaction_hash(transaction)
+    transaction['sign'] = sign_ecdsa_msg(secret_key, transaction['hash'])
+    return transaction
+
+
+def merkle_root(hashes: list[str]) -> str:
+    """Root of transaction hashes, the last one is paired with itself on odd levels"""
+    level = [bytes.fromhex(value) for value in hashes]
+    if not level:
+        return '00' * 32
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def merkle_proof(hashes: list[str], position: int) -> list[list]:
+    """[sibling hash, sibling is on the right] pairs from leaf to root"""
+    level = [bytes.fromhex(value) for value in hashes]
+    proof = []
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        sibling = position ^ 1
+        proof.append([level[sibling].hex(), sibling > position])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(transaction_hash: str, proof: list[list], root: str) -> bool:
+    current = bytes.fromhex(transaction_hash)
+    for sibling, right in proof:
+        if right:
+            current = hashlib.sha256(current + bytes.fromhex(sibling)).digest()
+        else:
+            current = hashlib.sha256(bytes.fromhex(sibling) + current).digest()
+    return current.hex() == root
+
+
+def block_header(block: dict) -> dict:
+    """Version 2 header without transactions, older blocks can't be hashed without their body"""
+    if block.get('version', 1) < VERSION:
+        return block
+    return {key: value for key, value in block.items() if key != 'transactions'}
+
+
+def short_id(transaction_hash: str) -> str:
+    """Prefix of transaction hash used to refer to mempool transactions in compact blocks"""
+    return transaction_hash[:SHORT_ID_LENGTH * 2]
+
+
+def compact_block(block: dict, prefilled=()) -> dict:
+    """Version 2 header with short ids of all transactions, those at prefilled positions are sent in full"""
+    compact = block_header(block)
+    compact['short_ids'] = [short_id(trn['hash']) for trn in block['transactions']]
+    compact['prefilled'] = [[position, block['transactions'][position]] for position in sorted(set(prefilled))]
+    return compact
+
+
+def encode_header(block: dict) -> bytes:
+    if block.get('version', 1) < VERSION:
+        raise ValueError(f"block {block['index']} has no binary form")
+    return _HEADER.pack(
+        block['version'],
+        block['index'],
+        block['timestamp'],
+        block['proof'],
+        bytes.fromhex(block['previous_hash']),
+        block['difficult'],
+        to_units(block['reward']),
+        bytes.fromhex(block['merkle_root'])
+    )
+
+
+def block_hash(block: dict) -> str:
+    """Version 2 hashes binary header, older blocks hash their JSON without the stored hash"""
+    if block.get('version', 1) >= VERSION:
+        return hashlib.sha256(encode_header(block)).hexdigest()
+    return elem_hash({key: value for key, value in block.items() if key != 'hash'})
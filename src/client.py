@@ -0,0 +1,72 @@
+import httpx
+from blockchain_utils import block_hash, create_transaction, verify_merkle_proof
+
+TIMEOUT = 10.0
+MAX_BATCH = 1000
+
+
+class NodeClient:
+    """Wallet side of a node API, keys never leave the client since transactions are signed locally"""
+
+    def __init__(self, url: str, timeout: float = TIMEOUT, transport: httpx.BaseTransport = None):
+        self.url = url
+        self.timeout = timeout
+        self.transport = transport
+        self._http = None
+
+    @property
+    def http(self) -> httpx.Client:
+        """Created on first request, building its SSL context is a good part of the wallet start"""
+        if self._http is None:
+            self._http = httpx.Client(base_url=self.url, timeout=self.timeout, transport=self.transport)
+        return self._http
+
+    def request(self, method: str, path: str, **kwargs):
+        response = self.http.request(method, path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def height(self) -> int:
+        return self.request('GET', '/chain/height')
+
+    def balance(self, public_key: str) -> float:
+        return self.request('GET', f'/address/{public_key}/balance')
+
+    def history(self, public_key: str, offset: int = 0, limit: int = 100) -> list[dict]:
+        return self.request('GET', f'/address/{public_key}/history', params={'offset': offset, 'limit': limit})
+
+    def transaction(self, transaction_hash: str) -> dict | None:
+        return self.request('GET', f'/tx/{transaction_hash}') or None
+
+    def send(self, public_key: str, secret_key: str, transfers: list[tuple[str, float, float]]) -> list[bool]:
+        """Sign (recipient, amount, fee) transfers and submit them in batches, status of every one"""
+        transactions = [
+            create_transaction(public_key, recipient, amount, fee, secret_key)
+            for recipient, amount, fee in transfers
+        ]
+        statuses = []
+        for start in range(0, len(transactions), MAX_BATCH):
+            statuses.extend(self.request('POST', '/transactions/batch', json=transactions[start:start + MAX_BATCH]))
+        return statuses
+
+    def transaction_proof(self, transaction_hash: str, index: int) -> dict | None:
+        """Header of block index and Merkle path of the transaction if the proof is valid"""
+        result = self.request('GET', '/block/proof', params={'index': index, 'hash': transaction_hash})
+        if not result or not verify_merkle_proof(transaction_hash, result['proof'], result['header']['merkle_root']):
+            return None
+        result['header']['hash'] = block_hash(result['header'])
+        return result
+
+    def start_mining(self) -> bool:
+        return self.request('POST', '/mining/start')
+
+    def stop_mining(self) -> bool:
+        return self.request('POST', '/mining/stop')
+
+    def mining_status(self) -> dict:
+        return self.request('GET', '/mining/status')
+
+    def close(self):
+        if self._http is not None:
+            self._http.close()
+            self._http = None
@@ -4,8 +4,15 @@ load_dotenv()
 
 SECRET_KEY = os.environ.get('SECRET_KEY')
 PUBLIC_KEY = os.environ.get('PUBLIC_KEY')
-NODES = os.environ.get('NODES')
-NODES = NODES.split(',')
+NODES = [node for node in os.environ.get('NODES', '').split(',') if node]
+NODE_URL = os.environ.get('NODE_URL', 'http://127.0.0.1:8000')
+MINER_WORKERS = int(os.environ.get('MINER_WORKERS', 0)) or os.cpu_count()
+VERIFY_WORKERS = int(os.environ.get('VERIFY_WORKERS', 0)) or os.cpu_count()
+SYNC_WINDOW = int(os.environ.get('SYNC_WINDOW', 8))
+ACTIVATION_HEIGHT = int(os.environ.get('ACTIVATION_HEIGHT', 1000))
+STORAGE = os.environ.get('STORAGE', 'mongo')
+DATA_DIR = os.environ.get('DATA_DIR', 'data')
+SNAPSHOT_SIGNERS = [key for key in os.environ.get('SNAPSHOT_SIGNERS', '').split(',') if key]
 DEBUG = True
 
 if __name__ == '__main__':
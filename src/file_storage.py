@@ -0,0 +1,276 @@
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+from metrics import metrics, timed
+from storage import GENESIS_BLOCK, Storage, index_entries
+
+RANGE_BATCH = 1000
+
+_OFFSET = struct.Struct('>Q')
+_LENGTH = struct.Struct('>I')
+
+
+class FileStorage(Storage):
+    """Embedded storage without a database server.
+
+    Blocks are appended as length prefixed JSON records to blocks.dat,
+    blocks.idx holds the offset of every block by index and is memory-mapped
+    for lookups. State, undo records and transaction indexes live in a SQLite file.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._data = self._open(os.path.join(path, 'blocks.dat'))
+        self._index = self._open(os.path.join(path, 'blocks.idx'))
+        self._map = None
+        self.height = 0
+        self._recover()
+        self._state = sqlite3.connect(os.path.join(path, 'state.sqlite'), check_same_thread=False)
+        with self._state:
+            self._state.execute('CREATE TABLE IF NOT EXISTS balances (key TEXT PRIMARY KEY, balance REAL)')
+            self._state.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+            self._state.execute('CREATE TABLE IF NOT EXISTS undo (idx INTEGER PRIMARY KEY, balances TEXT)')
+            self._state.execute(
+                'CREATE TABLE IF NOT EXISTS transactions (hash TEXT PRIMARY KEY, block INTEGER, position INTEGER)'
+            )
+            self._state.execute('CREATE INDEX IF NOT EXISTS transactions_block ON transactions (block)')
+            self._state.execute(
+                'CREATE TABLE IF NOT EXISTS history (address TEXT, block INTEGER, position INTEGER, hash TEXT)'
+            )
+            self._state.execute('CREATE INDEX IF NOT EXISTS history_address ON history (address, block, position)')
+            self._state.execute('CREATE INDEX IF NOT EXISTS history_block ON history (block)')
+        if self.height == 0:
+            self.append_batch([GENESIS_BLOCK])
+        elif self.height > 1 and self._state.execute('SELECT 1 FROM transactions LIMIT 1').fetchone() is None:
+            self.reindex()
+
+    @staticmethod
+    def _open(filename: str):
+        if not os.path.exists(filename):
+            open(filename, 'wb').close()
+        return open(filename, 'r+b')
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.height = os.fstat(self._index.fileno()).st_size // _OFFSET.size
+        if self.height:
+            self._map = mmap.mmap(self._index.fileno(), self.height * _OFFSET.size, access=mmap.ACCESS_READ)
+
+    def _offset(self, index: int) -> int:
+        return _OFFSET.unpack_from(self._map, (index - 1) * _OFFSET.size)[0]
+
+    def _data_size(self) -> int:
+        return os.fstat(self._data.fileno()).st_size
+
+    def _recover(self):
+        """Drop index entries without data and data without index entry after a crash"""
+        self._remap()
+        height = self.height
+        data_size = self._data_size()
+        end = 0
+        while height:
+            offset = self._offset(height)
+            self._data.seek(offset)
+            header = self._data.read(_LENGTH.size)
+            if len(header) == _LENGTH.size and offset + _LENGTH.size + _LENGTH.unpack(header)[0] <= data_size:
+                end = offset + _LENGTH.size + _LENGTH.unpack(header)[0]
+                break
+            height -= 1
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._index.truncate(height * _OFFSET.size)
+        self._data.truncate(end)
+        self._remap()
+
+    def _read(self, start: int, end: int) -> list[dict]:
+        """Blocks with index in [start, end), end <= height + 1"""
+        first = self._offset(start)
+        last = self._offset(end) if end <= self.height else self._data_size()
+        self._data.seek(first)
+        data = self._data.read(last - first)
+        blocks = []
+        position = 0
+        while position < len(data):
+            (length,) = _LENGTH.unpack_from(data, position)
+            position += _LENGTH.size
+            blocks.append(json.loads(data[position:position + length]))
+            position += length
+        return blocks
+
+    @timed('storage_seconds', backend='file')
+    def get_by_index(self, index: int) -> dict | None:
+        with self._lock:
+            if not 1 <= index <= self.height:
+                return None
+            return self._read(index, index + 1)[0]
+
+    def tip(self) -> dict:
+        return self.get_by_index(self.height)
+
+    def range(self, start: int, end: int = None):
+        return metrics.timed_iter('storage_seconds', self._range(start, end), backend='file', operation='range')
+
+    def _range(self, start: int, end: int = None):
+        start = max(start, 1)
+        while True:
+            with self._lock:
+                stop = self.height + 1 if end is None else min(end, self.height + 1)
+                if start >= stop:
+                    return
+                batch_end = min(start + RANGE_BATCH, stop)
+                blocks = self._read(start, batch_end)
+            yield from blocks
+            start = batch_end
+
+    @timed('storage_seconds', backend='file')
+    def append_batch(self, blocks):
+        blocks = list(blocks)
+        with self._lock:
+            offset = self._data_size()
+            data = []
+            offsets = []
+            for block in blocks:
+                if block['index'] != self.height + len(offsets) + 1:
+                    raise ValueError(f"block {block['index']} can't be appended at {self.height + len(offsets)}")
+                record = json.dumps(block, separators=(',', ':')).encode()
+                offsets.append(_OFFSET.pack(offset))
+                data.append(_LENGTH.pack(len(record)))
+                data.append(record)
+                offset += _LENGTH.size + len(record)
+            if not offsets:
+                return
+            self._put_index(blocks)
+            self._data.seek(0, os.SEEK_END)
+            self._data.write(b''.join(data))
+            self._data.flush()
+            if self.fsync:
+                os.fsync(self._data.fileno())
+            self._index.seek(0, os.SEEK_END)
+            self._index.write(b''.join(offsets))
+            self._index.flush()
+            if self.fsync:
+                os.fsync(self._index.fileno())
+            self._remap()
+
+    @timed('storage_seconds', backend='file')
+    def truncate_from(self, index: int):
+        with self._lock:
+            index = max(index, 1)
+            if index > self.height:
+                return
+            offset = self._offset(index)
+            self._map.close()
+            self._map = None
+            self._index.truncate((index - 1) * _OFFSET.size)
+            self._data.truncate(offset)
+            self._remap()
+            with self._state:
+                self._truncate_index(index)
+
+    def _put_index(self, blocks: list[dict]):
+        transactions, history = index_entries(blocks)
+        with self._state:
+            self._truncate_index(blocks[0]['index'])
+            self._state.executemany(
+                'INSERT OR REPLACE INTO transactions (hash, block, position) VALUES (?, ?, ?)', transactions
+            )
+            self._state.executemany('INSERT INTO history (address, block, position, hash) VALUES (?, ?, ?, ?)', history)
+
+    def _truncate_index(self, index: int):
+        self._state.execute('DELETE FROM transactions WHERE block >= ?', (index,))
+        self._state.execute('DELETE FROM history WHERE block >= ?', (index,))
+
+    @timed('storage_seconds', backend='file')
+    def transaction_location(self, transaction_hash: str) -> tuple[int, int] | None:
+        with self._lock:
+            return self._state.execute(
+                'SELECT block, position FROM transactions WHERE hash = ?', (transaction_hash,)
+            ).fetchone()
+
+    @timed('storage_seconds', backend='file')
+    def address_history(self, address: str, offset: int, limit: int) -> list[tuple[int, int, str]]:
+        with self._lock:
+            return self._state.execute(
+                'SELECT block, position, hash FROM history WHERE address = ? '
+                'ORDER BY block DESC, position DESC LIMIT ? OFFSET ?',
+                (address, limit, offset)
+            ).fetchall()
+
+    def reindex(self):
+        with self._lock:
+            with self._state:
+                self._truncate_index(1)
+            for block in range(1, self.height + 1, RANGE_BATCH):
+                self._put_index(self._read(block, min(block + RANGE_BATCH, self.height + 1)))
+
+    @timed('storage_seconds', backend='file')
+    def state_get(self) -> tuple[dict, int]:
+        with self._lock:
+            balances = dict(self._state.execute('SELECT key, balance FROM balances'))
+            row = self._state.execute("SELECT value FROM meta WHERE key = 'height'").fetchone()
+        return balances, row[0] if row else 1
+
+    @timed('storage_seconds', backend='file')
+    def state_put(self, balances: dict, height: int):
+        with self._lock, self._state:
+            self._state.executemany(
+                'DELETE FROM balances WHERE key = ?',
+                [(key,) for key, balance in balances.items() if balance is None]
+            )
+            self._state.executemany(
+                'INSERT OR REPLACE INTO balances (key, balance) VALUES (?, ?)',
+                [(key, balance) for key, balance in balances.items() if balance is not None]
+            )
+            self._state.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('height', ?)", (height,))
+
+    @timed('storage_seconds', backend='file')
+    def state_clear(self):
+        with self._lock, self._state:
+            self._state.execute('DELETE FROM balances')
+            self._state.execute('DELETE FROM meta')
+            self._state.execute('DELETE FROM undo')
+
+    @timed('storage_seconds', backend='file')
+    def undo_put(self, records: list[dict]):
+        with self._lock, self._state:
+            self._state.executemany(
+                'INSERT OR REPLACE INTO undo (idx, balances) VALUES (?, ?)',
+                [(record['index'], json.dumps(record['balances'])) for record in records]
+            )
+
+    @timed('storage_seconds', backend='file')
+    def undo_get(self, above: int) -> list[dict]:
+        with self._lock:
+            rows = self._state.execute('SELECT idx, balances FROM undo WHERE idx > ? ORDER BY idx DESC', (above,))
+            return [{'index': index, 'balances': json.loads(balances)} for index, balances in rows]
+
+    @timed('storage_seconds', backend='file')
+    def undo_count(self, above: int) -> int:
+        with self._lock:
+            return self._state.execute('SELECT COUNT(*) FROM undo WHERE idx > ?', (above,)).fetchone()[0]
+
+    @timed('storage_seconds', backend='file')
+    def undo_delete(self, start: int, end: int = None):
+        with self._lock, self._state:
+            if end is None:
+                self._state.execute('DELETE FROM undo WHERE idx >= ?', (start,))
+            else:
+                self._state.execute('DELETE FROM undo WHERE idx >= ? AND idx < ?', (start, end))
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._data.close()
+            self._index.close()
+            self._state.close()
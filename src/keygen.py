@@ -1,6 +1,13 @@
 import base64
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import ecdsa
-from ecdsa import BadSignatureError
+from ecdsa import BadSignatureError, MalformedPointError
+
+PARALLEL_VERIFY_MIN = 64
+
+_executor = None
 
 
 def generate_ecdsa_keys():
@@ -23,19 +30,39 @@ def sign_ecdsa_msg(private_key: str, message: str) -> str:
     return signature.decode()
 
 
+@lru_cache(maxsize=4096)
+def verifying_key(public_key: str) -> ecdsa.VerifyingKey:
+    return ecdsa.VerifyingKey.from_string(base64.b64decode(public_key), curve=ecdsa.SECP256k1)
+
+
 def validate_signature(public_key: str, signature: str, message: str) -> bool:
-    public_key = (base64.b64decode(public_key)).hex()
-    signature = base64.b64decode(signature)
-    vk = ecdsa.VerifyingKey.from_string(
-        bytes.fromhex(public_key),
-        curve=ecdsa.SECP256k1
-    )
     try:
-        return vk.verify(signature, message.encode())
-    except BadSignatureError:
+        return verifying_key(public_key).verify(base64.b64decode(signature), message.encode())
+    except (BadSignatureError, MalformedPointError, ValueError):
         return False
 
 
+def _validate_chunk(items: list[tuple[str, str, str]]) -> list[bool]:
+    return [validate_signature(*item) for item in items]
+
+
+def signature_executor(workers: int = None) -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+    return _executor
+
+
+def validate_signatures(items: list[tuple[str, str, str]], workers: int = None) -> list[bool]:
+    """Validate (public_key, signature, message) items, big batches are spread over a process pool"""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(items) < PARALLEL_VERIFY_MIN:
+        return _validate_chunk(items)
+    size = -(-len(items) // workers)
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    return [valid for chunk in signature_executor(workers).map(_validate_chunk, chunks) for valid in chunk]
+
+
 if __name__ == '__main__':
     result = None
     while result not in [1, 2, 3]:
@@ -0,0 +1,129 @@
+import heapq
+import json
+import threading
+from collections import defaultdict, deque
+from time import time
+from blockchain_utils import short_id
+
+MAX_COUNT = 50_000
+MAX_BYTES = 32 * 1024 * 1024
+TTL = 24 * 60 * 60
+
+
+class Mempool:
+    """Pending transactions ordered by fee per byte.
+
+    Heaps use lazy deletion: removed transactions stay in them until the next
+    compaction, an item is alive only if its sequence number is still current.
+    Public methods are safe to call from several threads.
+    """
+
+    def __init__(self, max_count: int = MAX_COUNT, max_bytes: int = MAX_BYTES, ttl: float = TTL):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.transactions = {}
+        self.bytes = 0
+        self._entries = {}
+        self._best = []
+        self._worst = []
+        self._by_age = deque()
+        self._by_sender = defaultdict(set)
+        self._seq = 0
+        self._stale = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.transactions)
+
+    def __contains__(self, transaction_hash: str) -> bool:
+        return transaction_hash in self.transactions
+
+    def get(self, transaction_hash: str) -> dict | None:
+        return self.transactions.get(transaction_hash)
+
+    def _alive(self, transaction_hash: str, seq: int) -> bool:
+        entry = self._entries.get(transaction_hash)
+        return entry is not None and entry[3] == seq
+
+    def add(self, transaction: dict, now: float = None) -> bool:
+        """Return False if transaction is known or was evicted right away"""
+        with self._lock:
+            now = time() if now is None else now
+            self.expire(now)
+            transaction_hash = transaction['hash']
+            if transaction_hash in self.transactions:
+                return False
+            size = len(json.dumps(transaction))
+            fee_rate = transaction['fee'] / size
+            self._seq += 1
+            self.transactions[transaction_hash] = transaction
+            self._entries[transaction_hash] = (fee_rate, size, now, self._seq)
+            heapq.heappush(self._best, (-fee_rate, self._seq, transaction_hash))
+            heapq.heappush(self._worst, (fee_rate, -self._seq, transaction_hash))
+            self._by_age.append((now, self._seq, transaction_hash))
+            self._by_sender[transaction['sender']].add(transaction_hash)
+            self.bytes += size
+            while len(self.transactions) > self.max_count or self.bytes > self.max_bytes:
+                if self._evict() == transaction_hash:
+                    return False
+            return True
+
+    def _evict(self) -> str:
+        while True:
+            fee_rate, seq, transaction_hash = heapq.heappop(self._worst)
+            if self._alive(transaction_hash, -seq):
+                self.remove(transaction_hash)
+                return transaction_hash
+
+    def remove(self, transaction_hash: str) -> dict | None:
+        with self._lock:
+            transaction = self.transactions.pop(transaction_hash, None)
+            if transaction is None:
+                return None
+            self.bytes -= self._entries.pop(transaction_hash)[1]
+            sender_hashes = self._by_sender[transaction['sender']]
+            sender_hashes.discard(transaction_hash)
+            if not sender_hashes:
+                del self._by_sender[transaction['sender']]
+            self._stale += 1
+            return transaction
+
+    def expire(self, now: float = None):
+        with self._lock:
+            now = time() if now is None else now
+            while self._by_age and self._by_age[0][0] + self.ttl < now:
+                added, seq, transaction_hash = self._by_age.popleft()
+                if self._alive(transaction_hash, seq):
+                    self.remove(transaction_hash)
+
+    def _compact(self):
+        if self._stale <= 0:
+            return
+        self._best = [(-entry[0], entry[3], key) for key, entry in self._entries.items()]
+        self._worst = [(entry[0], -entry[3], key) for key, entry in self._entries.items()]
+        heapq.heapify(self._best)
+        heapq.heapify(self._worst)
+        self._by_age = deque(item for item in self._by_age if self._alive(item[2], item[1]))
+        self._stale = 0
+
+    def short_ids(self) -> dict[str, dict]:
+        with self._lock:
+            return {short_id(key): transaction for key, transaction in self.transactions.items()}
+
+    def by_sender(self, sender: str) -> list[dict]:
+        with self._lock:
+            return [self.transactions[key] for key in self._by_sender.get(sender, ())]
+
+    def pending_spend(self, sender: str) -> float:
+        return sum(trn['amount'] + trn['fee'] for trn in self.by_sender(sender))
+
+    def select(self, limit: int) -> list[dict]:
+        """Best paying transactions first"""
+        with self._lock:
+            self.expire()
+            self._compact()
+            return [self.transactions[key] for _, _, key in heapq.nsmallest(limit, self._best)]
+
+    def page(self, offset: int, limit: int) -> list[dict]:
+        return self.select(offset + limit)[offset:]
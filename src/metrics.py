@@ -0,0 +1,126 @@
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    """Counters, gauges and histograms rendered in Prometheus text format"""
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            position = bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                histogram[0][position] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe seconds spent in the block, also when it raises"""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - started, **labels)
+
+    @contextmanager
+    def spent(self, name: str, **labels):
+        """Add seconds spent in the block to counter name, for time shares of stages repeated per call"""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.inc(name, perf_counter() - started, **labels)
+
+    def timed_iter(self, name: str, iterable, **labels):
+        """Yield from iterable, time spent fetching items is observed when it is exhausted or closed"""
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                started = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += perf_counter() - started
+                yield item
+        finally:
+            self.observe(name, elapsed, **labels)
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, values in [('counter', self._counters), ('gauge', self._gauges)]:
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f'# TYPE {name} {kind}')
+                    for (key, labels), value in sorted(values.items()):
+                        if key == name:
+                            lines.append(f'{name}{_labels(labels)} {value}')
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f'# TYPE {name} histogram')
+                for (key, labels), (counts, total, count) in sorted(self._histograms.items()):
+                    if key != name:
+                        continue
+                    cumulative = 0
+                    for bucket, bucket_count in zip(self.buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", bucket),))} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+                    lines.append(f'{name}_sum{_labels(labels)} {total}')
+                    lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+metrics = Metrics()
+
+
+def timed(name: str, **labels):
+    """Observe duration of every call of the decorated function, its name is the operation label"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(name, operation=function.__name__, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+import hashlib
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import Event
+from time import perf_counter
+from metrics import metrics
+
+CHECK_EVERY = 1 << 14
+
+_stop_event = None
+
+
+def proof_target(difficult: int) -> bytes:
+    """Digest must be below this value to have `difficult` leading hex zeros"""
+    if not 1 <= difficult <= 64:
+        raise ValueError(f'difficult must be in range 1..64, got {difficult}')
+    return (16 ** (64 - difficult)).to_bytes(32, 'big')
+
+
+def check_proof(last_proof: int, proof: int, difficult: int) -> bool:
+    guess = f'{last_proof}{proof}'.encode()
+    return hashlib.sha256(guess).digest() < proof_target(difficult)
+
+
+def search_range(last_proof: int, start: int, stop: int, target: bytes) -> tuple[int | None, int]:
+    """Return (proof or None, number of hashes done) for nonces in [start, stop)"""
+    prefix = hashlib.sha256(str(last_proof).encode())
+    hashes = 0
+    for block_start in range(start, stop, CHECK_EVERY):
+        if _stop_event is not None and _stop_event.is_set():
+            break
+        block_stop = min(block_start + CHECK_EVERY, stop)
+        for nonce in range(block_start, block_stop):
+            guess = prefix.copy()
+            guess.update(str(nonce).encode())
+            if guess.digest() < target:
+                return nonce, hashes + nonce - block_start + 1
+        hashes += block_stop - block_start
+    return None, hashes
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+class ParallelMiner:
+    def __init__(self, workers: int = None, chunk_size: int = 1 << 20):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.stop_event = Event()
+        self.hashes = 0
+        self.elapsed = 0.0
+        self._executor = None
+
+    @property
+    def hash_rate(self) -> float:
+        """Hashes per second of the last search"""
+        if not self.elapsed:
+            return 0.0
+        return self.hashes / self.elapsed
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.stop_event,)
+            )
+        return self._executor
+
+    def stop(self):
+        """Interrupt current search, search() will return None"""
+        self.stop_event.set()
+
+    def close(self):
+        if self._executor is not None:
+            self.stop_event.set()
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def reset(self):
+        """Allow next search to run, stop() after reset() interrupts it even before it started"""
+        self.stop_event.clear()
+
+    def search(self, last_proof: int, difficult: int, start: int = 0, reset: bool = True) -> int | None:
+        if reset:
+            self.reset()
+        target = proof_target(difficult)
+        executor = self.executor
+        started = perf_counter()
+        self.hashes = 0
+        next_start = start
+        pending = set()
+        for _ in range(self.workers * 2):
+            pending.add(executor.submit(search_range, last_proof, next_start, next_start + self.chunk_size, target))
+            next_start += self.chunk_size
+        proof = None
+        cancelled = False
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                nonce, hashes = future.result()
+                self.hashes += hashes
+                if nonce is not None and (proof is None or nonce < proof):
+                    proof = nonce
+            if proof is None and self.stop_event.is_set():
+                cancelled = True
+            if proof is not None or cancelled:
+                self.stop_event.set()
+                for future in pending:
+                    self.hashes += future.result()[1]
+                break
+            for _ in done:
+                pending.add(executor.submit(search_range, last_proof, next_start, next_start + self.chunk_size, target))
+                next_start += self.chunk_size
+        self.elapsed = perf_counter() - started
+        metrics.inc('miner_hashes_total', self.hashes)
+        metrics.set('miner_hash_rate', self.hash_rate)
+        return None if cancelled else proof
@@ -0,0 +1,77 @@
+import asyncio
+from time import time
+from metrics import metrics
+
+RETRY_DELAY = 5
+
+
+class MiningService:
+    """Mining loop running as a task on the API event loop.
+
+    Proof of work is searched in the miner's processes through a thread, so
+    requests are served while mining. Every new tip stops the miner and the
+    loop starts over on top of it with a fresh template from the mempool.
+    """
+
+    def __init__(self, blockchain):
+        self.blockchain = blockchain
+        self.task = None
+        self.started = None
+        self.mined = 0
+        self.restarts = 0
+        self.last_mined = None
+        self.error = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self) -> bool:
+        """Return False if already running"""
+        if self.running:
+            return False
+        self.error = None
+        self.started = time()
+        self.task = asyncio.create_task(self._run())
+        return True
+
+    async def stop(self) -> bool:
+        """Return False if not running"""
+        if not self.running:
+            return False
+        self.task.cancel()
+        self.blockchain.miner.stop()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    def status(self) -> dict:
+        return {
+            'running': self.running,
+            'started': self.started,
+            'height': self.blockchain.last_block['index'],
+            'mined': self.mined,
+            'restarts': self.restarts,
+            'last_mined': self.last_mined,
+            'hash_rate': self.blockchain.miner.hash_rate,
+            'error': self.error
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                block = await self.blockchain.mine()
+            except Exception as error:
+                self.error = repr(error)
+                metrics.inc('mining_errors_total')
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            if block is None:
+                self.restarts += 1
+                metrics.inc('mining_restarts_total')
+            else:
+                self.mined += 1
+                metrics.inc('blocks_mined_total')
+                self.last_mined = block['index']
@@ -1,26 +1,161 @@
 import pymongo
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from metrics import metrics, timed
+from storage import GENESIS_BLOCK, Storage, index_entries
 
+CHECKPOINT_ID = '__checkpoint__'
+RANGE_BATCH = 1000
 
-class Mongo:
-    def __init__(self):
-        self.BLOCKCHAIN = 'blockchain'
-        self.FIRST_BLOCK = {
-            'index': 1,
-            'timestamp': 1696793687.5292575,
-            'transactions': [],
-            'proof': 100,
-            'previous_hash': 1,
-            'difficult': 6,
-            'reward': 50
-        }
-        client = pymongo.MongoClient()
-        database_names = client.list_database_names()
-        if self.BLOCKCHAIN not in database_names:
-            self.db = client[self.BLOCKCHAIN]
-            self.block_collection = self.db.create_collection('blocks')
-            self.state_collection = self.db.create_collection('states')
-            self.block_collection.insert_one(self.FIRST_BLOCK)
-        else:
-            self.db = client[self.BLOCKCHAIN]
-            self.block_collection = self.db.get_collection('blocks')
-            self.state_collection = self.db.get_collection('states')
+
+class Mongo(Storage):
+    def __init__(self, client: pymongo.MongoClient = None, name: str = 'blockchain'):
+        self.BLOCKCHAIN = name
+        self.FIRST_BLOCK = dict(GENESIS_BLOCK)
+        client = client or pymongo.MongoClient()
+        self.db = client[self.BLOCKCHAIN]
+        self.block_collection = self.db.get_collection('blocks')
+        self.state_collection = self.db.get_collection('states')
+        self.undo_collection = self.db.get_collection('undo')
+        self.transaction_collection = self.db.get_collection('transactions')
+        self.history_collection = self.db.get_collection('history')
+        self.block_collection.create_index('index', unique=True)
+        self.transaction_collection.create_index('block')
+        self.history_collection.create_index('block')
+        self.history_collection.create_index(
+            [('address', pymongo.ASCENDING), ('block', pymongo.DESCENDING), ('position', pymongo.DESCENDING)]
+        )
+        if self.block_collection.find_one({'index': 1}, {'_id': True}) is None:
+            self.block_collection.insert_one(dict(self.FIRST_BLOCK))
+        elif self.transaction_collection.find_one({}, {'_id': True}) is None and self.tip()['index'] > 1:
+            self.reindex()
+
+    @timed('storage_seconds', backend='mongo')
+    def get_by_index(self, index: int) -> dict | None:
+        return self.block_collection.find_one({'index': index}, {'_id': False})
+
+    @timed('storage_seconds', backend='mongo')
+    def tip(self) -> dict:
+        return self.block_collection.find_one({}, {'_id': False}, sort=[('index', pymongo.DESCENDING)])
+
+    def range(self, start: int, end: int = None):
+        query = {'$gte': start}
+        if end is not None:
+            query['$lt'] = end
+        cursor = self.block_collection.find(
+            {'index': query},
+            {'_id': False},
+            sort=[('index', pymongo.ASCENDING)],
+            batch_size=RANGE_BATCH
+        )
+        return metrics.timed_iter('storage_seconds', cursor, backend='mongo', operation='range')
+
+    @timed('storage_seconds', backend='mongo')
+    def append_batch(self, blocks):
+        blocks = [dict(block) for block in blocks]
+        if blocks:
+            self._put_index(blocks)
+            self.block_collection.insert_many(blocks)
+
+    @timed('storage_seconds', backend='mongo')
+    def truncate_from(self, index: int):
+        self.block_collection.delete_many({'index': {'$gte': index}})
+        self._truncate_index(index)
+
+    def _put_index(self, blocks: list[dict]):
+        self._truncate_index(blocks[0]['index'])
+        transactions, history = index_entries(blocks)
+        if transactions:
+            self.transaction_collection.bulk_write([
+                ReplaceOne({'_id': key}, {'block': block, 'position': position}, upsert=True)
+                for key, block, position in transactions
+            ])
+        if history:
+            self.history_collection.insert_many([
+                {'address': address, 'block': block, 'position': position, 'hash': key}
+                for address, block, position, key in history
+            ])
+
+    def _truncate_index(self, index: int):
+        self.transaction_collection.delete_many({'block': {'$gte': index}})
+        self.history_collection.delete_many({'block': {'$gte': index}})
+
+    @timed('storage_seconds', backend='mongo')
+    def transaction_location(self, transaction_hash: str) -> tuple[int, int] | None:
+        doc = self.transaction_collection.find_one({'_id': transaction_hash})
+        if doc is None:
+            return None
+        return doc['block'], doc['position']
+
+    @timed('storage_seconds', backend='mongo')
+    def address_history(self, address: str, offset: int, limit: int) -> list[tuple[int, int, str]]:
+        cursor = self.history_collection.find(
+            {'address': address},
+            sort=[('block', pymongo.DESCENDING), ('position', pymongo.DESCENDING)],
+            skip=offset,
+            limit=limit
+        )
+        return [(doc['block'], doc['position'], doc['hash']) for doc in cursor]
+
+    def reindex(self):
+        self._truncate_index(1)
+        batch = []
+        for block in self.range(1):
+            batch.append(block)
+            if len(batch) >= RANGE_BATCH:
+                self._put_index(batch)
+                batch = []
+        if batch:
+            self._put_index(batch)
+
+    @timed('storage_seconds', backend='mongo')
+    def state_get(self) -> tuple[dict, int]:
+        balances = {}
+        height = 1
+        for doc in self.state_collection.find():
+            if doc['_id'] == CHECKPOINT_ID:
+                height = doc['index']
+            else:
+                balances[doc['_id']] = doc['balance']
+        return balances, height
+
+    @timed('storage_seconds', backend='mongo')
+    def state_put(self, balances: dict, height: int):
+        requests = []
+        for public_key, balance in balances.items():
+            if balance is None:
+                requests.append(DeleteOne({'_id': public_key}))
+            else:
+                requests.append(UpdateOne({'_id': public_key}, {'$set': {'balance': balance}}, upsert=True))
+        requests.append(UpdateOne({'_id': CHECKPOINT_ID}, {'$set': {'index': height}}, upsert=True))
+        self.state_collection.bulk_write(requests)
+
+    @timed('storage_seconds', backend='mongo')
+    def state_clear(self):
+        self.state_collection.delete_many({})
+        self.undo_collection.delete_many({})
+
+    @timed('storage_seconds', backend='mongo')
+    def undo_put(self, records: list[dict]):
+        if records:
+            self.undo_collection.bulk_write(
+                [ReplaceOne({'index': record['index']}, dict(record), upsert=True) for record in records]
+            )
+
+    @timed('storage_seconds', backend='mongo')
+    def undo_get(self, above: int) -> list[dict]:
+        return list(self.undo_collection.find(
+            {'index': {'$gt': above}},
+            {'_id': False},
+            sort=[('index', pymongo.DESCENDING)]
+        ))
+
+    @timed('storage_seconds', backend='mongo')
+    def undo_count(self, above: int) -> int:
+        return self.undo_collection.count_documents({'index': {'$gt': above}})
+
+    @timed('storage_seconds', backend='mongo')
+    def undo_delete(self, start: int, end: int = None):
+        query = {'$gte': start}
+        if end is not None:
+            query['$lt'] = end
+        self.undo_collection.delete_many({'index': query})
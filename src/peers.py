@@ -0,0 +1,124 @@
+import asyncio
+from time import monotonic, perf_counter
+import httpx
+from blockchain_utils import EMISSION_ADDRESS, VERSION, compact_block
+from metrics import metrics
+
+TIMEOUT = 5.0
+BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+RELAY_BATCH = 1000
+
+
+class PeerClient:
+    """Keep-alive HTTP session per peer with parallel fan-out.
+
+    A failed peer is skipped by fan-out calls for an exponentially growing
+    backoff period, the first successful request resets it.
+    """
+
+    def __init__(self, nodes, timeout: float = TIMEOUT, transports: dict = None):
+        self.nodes = [node for node in nodes if node]
+        self.timeout = timeout
+        self.transports = {} if transports is None else transports
+        self._clients = {}
+        self._loop = None
+        self._failures = {}
+        self._retry_at = {}
+
+    def client(self, node: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._clients = {}
+            self._loop = loop
+        if node not in self._clients:
+            self._clients[node] = httpx.AsyncClient(
+                base_url=node,
+                timeout=self.timeout,
+                transport=self.transports.get(node),
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4)
+            )
+        return self._clients[node]
+
+    def available(self) -> list[str]:
+        now = monotonic()
+        return [node for node in self.nodes if self._retry_at.get(node, 0) <= now]
+
+    def _failed(self, node: str):
+        self._failures[node] = self._failures.get(node, 0) + 1
+        self._retry_at[node] = monotonic() + min(MAX_BACKOFF, BACKOFF * 2 ** (self._failures[node] - 1))
+
+    async def request(self, node: str, method: str, path: str, **kwargs):
+        """Return decoded JSON or None if peer failed"""
+        started = perf_counter()
+        try:
+            response = await self.client(node).request(method, path, **kwargs)
+            response.raise_for_status()
+            result = response.json()
+        except (httpx.HTTPError, ValueError) as error:
+            metrics.inc('peer_request_failures_total', path=path, error=type(error).__name__)
+            self._failed(node)
+            return None
+        finally:
+            metrics.observe('peer_request_seconds', perf_counter() - started, path=path)
+        self._failures.pop(node, None)
+        self._retry_at.pop(node, None)
+        return result
+
+    async def fan_out(self, method: str, path: str, nodes: list[str] = None, **kwargs) -> dict:
+        """Send request to all available peers at once, failed peers are left out"""
+        nodes = self.available() if nodes is None else nodes
+        results = await asyncio.gather(*(self.request(node, method, path, **kwargs) for node in nodes))
+        return {node: result for node, result in zip(nodes, results) if result is not None}
+
+    async def heights(self) -> dict[str, int]:
+        return await self.fan_out('GET', '/chain/height')
+
+    async def mempool(self, limit: int) -> list[dict]:
+        pages = await self.fan_out('GET', '/transactions/existing', params={'limit': limit})
+        return [transaction for page in pages.values() for transaction in page]
+
+    async def broadcast_block(self, block: dict) -> dict:
+        """Version 2 blocks are sent in compact form"""
+        if block.get('version', 1) < VERSION:
+            return await self.fan_out('POST', '/block/get', json=block)
+        nodes = self.available()
+        results = await asyncio.gather(*(self._send_compact(node, block) for node in nodes))
+        return {node: result for node, result in zip(nodes, results) if result is not None}
+
+    async def _send_compact(self, node: str, block: dict):
+        """Emission transaction is never in mempool, other transactions are sent if peer asks for them.
+        A reply listing anything but positions of block transactions is a failure"""
+        prefilled = [i for i, trn in enumerate(block['transactions']) if trn['sender'] == EMISSION_ADDRESS]
+        result = await self.request(node, 'POST', '/block/compact', json=compact_block(block, prefilled))
+        if isinstance(result, list):
+            positions = range(len(block['transactions']))
+            if not all(type(position) is int and position in positions for position in result):
+                return None
+            result = await self.request(node, 'POST', '/block/compact', json=compact_block(block, prefilled + result))
+        return result
+
+    async def relay_transactions(self, transactions: list[dict], nodes: list[str] = None) -> dict[str, list]:
+        """Announce hashes to peers first (inv), then send each peer only the transactions it asked for.
+
+        Return statuses of sent transactions by peer.
+        """
+        nodes = self.available() if nodes is None else nodes
+        results = await asyncio.gather(*(self._relay(node, transactions) for node in nodes))
+        return dict(zip(nodes, results))
+
+    async def _relay(self, node: str, transactions: list[dict]) -> list:
+        statuses = []
+        for start in range(0, len(transactions), RELAY_BATCH):
+            batch = {trn['hash']: trn for trn in transactions[start:start + RELAY_BATCH]}
+            wanted = await self.request(node, 'POST', '/transactions/inv', json=list(batch))
+            if wanted is None:
+                break
+            wanted = [batch[key] for key in wanted if key in batch]
+            if wanted:
+                statuses.extend(await self.request(node, 'POST', '/transactions/batch', json=wanted) or [])
+        return statuses
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        await asyncio.gather(*(client.aclose() for client in clients.values()))
@@ -0,0 +1,68 @@
+import sys
+import threading
+from collections import Counter
+
+INTERVAL = 0.005
+
+
+class SamplingProfiler:
+    """Samples stacks of all threads every interval seconds while running.
+
+    Results are collapsed stacks (root;...;leaf count) which flamegraph tools
+    read directly, worker processes of the miner are not sampled.
+    """
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = None) -> bool:
+        """Return False if already running, previous samples are dropped"""
+        if self.running:
+            return False
+        self.interval = interval or self.interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> bool:
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        return True
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+    def top(self, limit: int = 20) -> list[list]:
+        """[function, share of samples it was on top of a stack] sorted by share"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [[function, count / total] for function, count in leaves.most_common(limit)]
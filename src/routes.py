@@ -0,0 +1,204 @@
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from blockchain import Blockchain
+from blockchain_utils import VERSION, block_header, merkle_proof
+from metrics import metrics
+from profiler import SamplingProfiler
+
+MAX_RANGE = 1000
+MAX_HEADERS = 10000
+MAX_BATCH = 1000
+
+
+class Transaction(BaseModel):
+    sender: str
+    recipient: str
+    amount: float
+    fee: float
+
+
+class TransactionGet(Transaction):
+    version: int = 1
+    timestamp: float
+    hash: str
+    sign: str
+
+
+class Block(BaseModel):
+    version: int = 1
+    index: int
+    timestamp: float
+    transactions: list
+    proof: int
+    previous_hash: str
+    difficult: int
+    reward: int | float
+    merkle_root: str = None
+    hash: str = None
+
+
+class CompactBlock(BaseModel):
+    version: int
+    index: int
+    timestamp: float
+    proof: int
+    previous_hash: str
+    difficult: int
+    reward: int | float
+    merkle_root: str
+    hash: str = None
+    short_ids: list[str]
+    prefilled: list = []
+
+
+def create_app(blockchain: Blockchain) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        await blockchain.mining.stop()
+        profiler.stop()
+
+    app = FastAPI(lifespan=lifespan)
+    profiler = SamplingProfiler()
+
+    @app.get('/chain/height')
+    async def get_chain_height():
+        return blockchain.last_block['index']
+
+    @app.get('/block/send')
+    async def get_part_of_chain(start: int, length: int):
+        if length > 10 or start >= blockchain.last_block['index']:
+            return False
+        return blockchain.blocks(start + 1, length - 1)
+
+    @app.get('/block/range')
+    async def get_block_range(start: int, length: int):
+        """Up to MAX_RANGE blocks starting from start inclusive"""
+        return blockchain.blocks(start, min(max(length, 0), MAX_RANGE))
+
+    @app.get('/block/headers')
+    async def get_block_headers(start: int, length: int):
+        """Headers are full blocks for blocks older than version 2"""
+        return [block_header(block) for block in blockchain.blocks(start, min(max(length, 0), MAX_HEADERS))]
+
+    @app.get('/block/proof')
+    async def get_transaction_proof(index: int, hash: str):
+        """Header of block index and Merkle path of transaction hash in it"""
+        if not 1 <= index <= blockchain.last_block['index']:
+            return False
+        block = blockchain.block_by_index(index)
+        hashes = [trn['hash'] for trn in block['transactions']]
+        if block.get('version', 1) < VERSION or hash not in hashes:
+            return False
+        return {'header': block_header(block), 'proof': merkle_proof(hashes, hashes.index(hash))}
+
+    @app.get('/tx/{transaction_hash}')
+    async def get_transaction_by_hash(transaction_hash: str):
+        return blockchain.transaction_by_hash(transaction_hash) or False
+
+    @app.get('/address/{public_key:path}/history')
+    async def get_address_history(public_key: str, offset: int = 0, limit: int = 100):
+        """Newest transactions first, up to MAX_RANGE per page"""
+        return blockchain.address_history(public_key, max(offset, 0), min(max(limit, 0), MAX_RANGE))
+
+    @app.get('/address/{public_key:path}/balance')
+    async def get_address_balance(public_key: str):
+        return blockchain.check_balance(public_key)
+
+    @app.post("/transactions/get")
+    async def get_transaction(trn: TransactionGet, background_tasks: BackgroundTasks):
+        """Relayed to peers after the response, so a request doesn't wait for the whole network"""
+        transaction = trn.model_dump(exclude_unset=True)
+        if not await asyncio.to_thread(blockchain.add_transaction, transaction):
+            return False
+        background_tasks.add_task(blockchain.peers.relay_transactions, [transaction])
+        return True
+
+    @app.post('/transactions/batch')
+    async def get_transactions(transactions: list[TransactionGet], background_tasks: BackgroundTasks):
+        """Status of every transaction, accepted ones are relayed to peers after the response"""
+        if len(transactions) > MAX_BATCH:
+            return False
+        transactions = [trn.model_dump(exclude_unset=True) for trn in transactions]
+        statuses = await asyncio.to_thread(blockchain.add_transactions, transactions)
+        accepted = [trn for trn, status in zip(transactions, statuses) if status]
+        if accepted:
+            background_tasks.add_task(blockchain.peers.relay_transactions, accepted)
+        return statuses
+
+    @app.post('/transactions/inv')
+    async def transactions_inventory(hashes: list[str]):
+        """Hashes of announced transactions this node doesn't have yet"""
+        return [key for key in hashes[:MAX_BATCH] if not blockchain.known_transaction(key)]
+
+    @app.get("/transactions/existing")
+    async def existing_transaction(offset: int = 0, limit: int = 100):
+        """Mempool page, best paying transactions first"""
+        return blockchain.mempool.page(max(offset, 0), min(max(limit, 0), 1000))
+
+    @app.post("/block/get")
+    async def get_block(block: Block, background_tasks: BackgroundTasks):
+        """Broadcast to peers after the response"""
+        new_block = block.model_dump(exclude_unset=True)
+        if not await asyncio.to_thread(blockchain.append_blocks, [new_block]):
+            return False
+        background_tasks.add_task(blockchain.peers.broadcast_block, new_block)
+        return True
+
+    @app.post('/mining/start')
+    async def start_mining():
+        return blockchain.mining.start()
+
+    @app.post('/mining/stop')
+    async def stop_mining():
+        return await blockchain.mining.stop()
+
+    @app.get('/mining/status')
+    async def mining_status():
+        return blockchain.mining.status()
+
+    @app.get('/metrics', response_class=PlainTextResponse)
+    async def get_metrics():
+        """Prometheus text format"""
+        metrics.set('chain_height', blockchain.last_block['index'])
+        metrics.set('state_height', blockchain.state.height)
+        metrics.set('mempool_transactions', len(blockchain.mempool))
+        metrics.set('mempool_bytes', blockchain.mempool.bytes)
+        metrics.set('mining_running', int(blockchain.mining.running))
+        return metrics.render()
+
+    @app.post('/profiler/start')
+    async def start_profiler(interval: float = None):
+        return profiler.start(interval)
+
+    @app.post('/profiler/stop')
+    async def stop_profiler():
+        return profiler.stop()
+
+    @app.get('/profiler', response_class=PlainTextResponse)
+    async def get_profile():
+        """Collapsed stacks of the last or running profile, input for flamegraph tools"""
+        return profiler.collapsed()
+
+    @app.get('/profiler/top')
+    async def get_profile_top(limit: int = 20):
+        return {'running': profiler.running, 'samples': profiler.samples, 'top': profiler.top(limit)}
+
+    @app.post('/block/compact')
+    async def get_compact_block(compact: CompactBlock, background_tasks: BackgroundTasks):
+        """True if block was added, positions of transactions to send in full if mempool lacks them,
+        added blocks are broadcast after the response"""
+        if compact.version < VERSION or compact.index != blockchain.last_block['index'] + 1:
+            return False
+        block, missing = blockchain.reconstruct_block(compact.model_dump(exclude_unset=True))
+        if block is None:
+            return missing or False
+        if not await asyncio.to_thread(blockchain.append_blocks, [block]):
+            return False
+        background_tasks.add_task(blockchain.peers.broadcast_block, block)
+        return True
+
+    return app
@@ -0,0 +1,147 @@
+import math
+import threading
+from collections import ChainMap
+from time import time
+
+DIFFICULT = 8
+REWARD = 50
+EPOCH_BLOCKS = 100
+BLOCK_INTERVAL = 60
+HALVING_BLOCKS = 210_000
+ACTIVATION_HEIGHT = 1000
+MAX_DIFFICULT = 64
+MAX_FUTURE = 2 * 60 * 60
+
+
+class Schedule:
+    """Difficulty and reward of a block by its index.
+
+    Blocks below the activation height keep the initial difficulty and reward,
+    so chains mined before retargeting stay valid. From there on difficulty is
+    retargeted every epoch_blocks blocks from the average block interval of the
+    previous epoch, by at most one hex zero at a time, and reward halves every
+    halving_blocks blocks. Epoch values are cached as (difficult, timestamp of
+    the first block) and are computed once, validation works on a ChainMap view
+    of the cache which is committed when blocks are stored. epoch_blocks=0
+    keeps difficulty fixed.
+    """
+
+    def __init__(
+            self, db,
+            difficult: int = DIFFICULT,
+            reward: float = REWARD,
+            epoch_blocks: int = EPOCH_BLOCKS,
+            interval: float = BLOCK_INTERVAL,
+            halving_blocks: int = HALVING_BLOCKS,
+            activation: int = ACTIVATION_HEIGHT):
+        if epoch_blocks and epoch_blocks < 2:
+            raise ValueError(f'epoch must be at least 2 blocks, got {epoch_blocks}')
+        if activation < 2:
+            raise ValueError(f'activation has to be above the genesis block, got {activation}')
+        self.db = db
+        self.initial_difficult = difficult
+        self.initial_reward = reward
+        self.epoch_blocks = epoch_blocks
+        self.interval = interval
+        self.halving_blocks = halving_blocks
+        self.activation = activation
+        self.epochs = {}
+        self._lock = threading.RLock()
+
+    def epoch(self, index: int) -> int:
+        return (index - self.activation) // self.epoch_blocks
+
+    def start(self, epoch: int) -> int:
+        """Index of the first block of epoch"""
+        return self.activation + epoch * self.epoch_blocks
+
+    def reward(self, index: int) -> float:
+        halvings = max(index - self.activation, 0) // self.halving_blocks
+        return round(self.initial_reward / 2 ** halvings, 8) if halvings < 64 else 0
+
+    def valid_timestamp(self, block: dict, previous_block: dict) -> bool:
+        """Timestamps drive retargeting, so they can't run ahead of local time by more than MAX_FUTURE
+        and from the activation height on they can't go back"""
+        if not isinstance(block['timestamp'], (int, float)) or block['timestamp'] > time() + MAX_FUTURE:
+            return False
+        return block['index'] < self.activation or block['timestamp'] >= previous_block['timestamp']
+
+    def retarget(self, difficult: int, span: float, intervals: int) -> int:
+        """One hex zero changes work 16 times, so difficulty moves when blocks are 4 times off the interval"""
+        average = max(span, 1) / intervals
+        step = max(-1, min(1, round(math.log(self.interval / average, 16))))
+        return max(1, min(MAX_DIFFICULT, difficult + step))
+
+    def view(self, height: int) -> ChainMap:
+        """Scratch copy of epochs known for the chain up to height"""
+        with self._lock:
+            return ChainMap({}, {
+                epoch: value for epoch, value in self.epochs.items() if self.start(epoch) <= height
+            })
+
+    def commit(self, epochs: ChainMap, height: int):
+        """Keep epochs of a view whose blocks up to height were stored"""
+        with self._lock:
+            self.epochs.update(
+                (epoch, value) for epoch, value in epochs.maps[0].items() if self.start(epoch) <= height
+            )
+
+    def truncate(self, index: int):
+        """Blocks above index were removed"""
+        with self._lock:
+            for epoch in [epoch for epoch in self.epochs if self.start(epoch) > index]:
+                del self.epochs[epoch]
+
+    def clear(self):
+        with self._lock:
+            self.epochs.clear()
+
+    def difficult(self, previous_block: dict) -> int:
+        """Difficulty of the block on top of previous_block, which has to be stored"""
+        epochs = self.view(previous_block['index'])
+        difficult = self.expected(previous_block['index'] + 1, previous_block, epochs)
+        self.commit(epochs, previous_block['index'])
+        return difficult
+
+    def check(self, block: dict, previous_block: dict, epochs: ChainMap) -> bool:
+        """Difficulty and reward of block are scheduled ones, records the epoch in epochs.
+        Blocks below previous_block have to be stored or checked with the same epochs before."""
+        index = block['index']
+        difficult = self.expected(index, previous_block, epochs)
+        if self.epoch_blocks and index >= self.activation and index == self.start(self.epoch(index)):
+            epochs[self.epoch(index)] = (difficult, block['timestamp'])
+        return block['difficult'] == difficult and block['reward'] == self.reward(block['index'])
+
+    def expected(self, index: int, previous_block: dict, epochs: ChainMap) -> int:
+        if not self.epoch_blocks or index < self.activation:
+            return self.initial_difficult
+        epoch = self.epoch(index)
+        if epoch in epochs:
+            return epochs[epoch][0]
+        if epoch == 0:
+            return self.initial_difficult
+        if index == self.start(epoch):
+            difficult, started = self._entry(epoch - 1, epochs)
+            return self.retarget(
+                difficult, previous_block['timestamp'] - started, previous_block['index'] - self.start(epoch - 1)
+            )
+        return self._entry(epoch, epochs)[0]
+
+    def _entry(self, epoch: int, epochs: ChainMap) -> tuple[int, float]:
+        """Epoch values computed from stored blocks, starting from the last known epoch"""
+        if epoch in epochs:
+            return epochs[epoch]
+        known = max((key for key in epochs if key < epoch), default=None)
+        if known is None:
+            known = 0
+            epochs[0] = (self.initial_difficult, self._timestamp(self.start(0)))
+        difficult, started = epochs[known]
+        for current in range(known + 1, epoch + 1):
+            last = self.start(current) - 1
+            difficult = self.retarget(difficult, self._timestamp(last) - started, last - self.start(current - 1))
+            started = self._timestamp(self.start(current))
+            epochs[current] = (difficult, started)
+        return epochs[epoch]
+
+    def _timestamp(self, index: int) -> float:
+        return self.db.get_by_index(index)['timestamp']
@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import json
+import os
+import sys
+from time import time
+from blockchain_utils import block_hash
+from keygen import sign_ecdsa_msg, validate_signature
+
+FORMAT = 1
+CHUNK_BLOCKS = 1000
+MANIFEST = 'manifest.json'
+STATE_FILE = 'state.json.gz'
+
+
+def _digest(manifest: dict) -> str:
+    return hashlib.sha256(json.dumps(
+        {key: value for key, value in manifest.items() if key != 'sign'}, sort_keys=True
+    ).encode()).hexdigest()
+
+
+def _write_gzip(path: str, lines) -> str:
+    """Write JSON lines compressed, return sha256 of the file"""
+    with gzip.open(path, 'wt', compresslevel=6) as file:
+        for line in lines:
+            file.write(json.dumps(line, separators=(',', ':')))
+            file.write('\n')
+    return _checksum(path)
+
+
+def _checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(1 << 20), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _read_gzip(directory: str, name: str, checksum: str):
+    path = os.path.join(directory, name)
+    if _checksum(path) != checksum:
+        raise ValueError(f'checksum mismatch in {name}')
+    with gzip.open(path, 'rt') as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def _write_chunks(db, directory: str, start: int, end: int, chunk_blocks: int) -> list[dict]:
+    chunks = []
+    for chunk_start in range(start, end, chunk_blocks):
+        chunk_end = min(chunk_start + chunk_blocks, end)
+        name = f'blocks-{chunk_start:010d}.json.gz'
+        checksum = _write_gzip(os.path.join(directory, name), db.range(chunk_start, chunk_end))
+        chunks.append({'file': name, 'start': chunk_start, 'end': chunk_end, 'sha256': checksum})
+    return chunks
+
+
+def _write_manifest(directory: str, manifest: dict):
+    with open(os.path.join(directory, MANIFEST), 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+
+def export_blocks(blockchain, directory: str, start: int, end: int = None, chunk_blocks: int = CHUNK_BLOCKS) -> dict:
+    """Write blocks in [start, end) as compressed chunks, importing them validates every block"""
+    os.makedirs(directory, exist_ok=True)
+    end = blockchain.last_block['index'] + 1 if end is None else end
+    manifest = {
+        'format': FORMAT,
+        'height': None,
+        'created': time(),
+        'chunks': _write_chunks(blockchain.db, directory, max(start, 1), end, chunk_blocks)
+    }
+    _write_manifest(directory, manifest)
+    return manifest
+
+
+def export_snapshot(blockchain, directory: str, public_key: str, secret_key: str,
+                    chunk_blocks: int = CHUNK_BLOCKS) -> dict:
+    """Write state at the validated height and blocks up to it as compressed chunks with a signed manifest"""
+    os.makedirs(directory, exist_ok=True)
+    with blockchain.lock:
+        balances = dict(blockchain.state.balances)
+        height = blockchain.state.height
+        snapshot_hash = blockchain.cache.hash(blockchain.block_by_index(height))
+    manifest = {
+        'format': FORMAT,
+        'height': height,
+        'hash': snapshot_hash,
+        'created': time(),
+        'state': {'file': STATE_FILE, 'sha256': _write_gzip(os.path.join(directory, STATE_FILE), balances.items())},
+        'chunks': _write_chunks(blockchain.db, directory, 1, height + 1, chunk_blocks),
+        'signer': public_key
+    }
+    manifest['sign'] = sign_ecdsa_msg(secret_key, _digest(manifest))
+    _write_manifest(directory, manifest)
+    return manifest
+
+
+def read_manifest(directory: str, trusted: list[str]) -> dict:
+    """Manifests with state have to be signed by a trusted key"""
+    with open(os.path.join(directory, MANIFEST)) as file:
+        manifest = json.load(file)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f"unsupported snapshot format {manifest.get('format')}")
+    if manifest.get('state') is None:
+        return manifest
+    if manifest.get('signer') not in trusted:
+        raise ValueError('snapshot is signed by an untrusted key')
+    if not validate_signature(manifest['signer'], manifest['sign'], _digest(manifest)):
+        raise ValueError('bad snapshot signature')
+    return manifest
+
+
+def import_snapshot(blockchain, directory: str, trusted: list[str] = ()) -> int:
+    """Import blocks and state written by export_snapshot or blocks written by export_blocks.
+
+    Blocks up to snapshot height are stored checking only their hashes and links, their
+    signatures and balances are trusted to the snapshot signer. Other blocks are validated
+    and appended as usual. Return the new chain height.
+    """
+    manifest = read_manifest(directory, trusted)
+    height = manifest['height'] or 0
+    with blockchain.lock:
+        previous_block = None
+        previous_hash = None
+        for chunk in manifest['chunks']:
+            batch = []
+            for block in _read_gzip(directory, chunk['file'], chunk['sha256']):
+                if block['index'] > height:
+                    batch.append(block)
+                    continue
+                computed = block_hash(block)
+                if block.get('hash', computed) != computed:
+                    raise ValueError(f"block {block['index']} has wrong hash")
+                if previous_block is not None and (
+                        block['index'] != previous_block['index'] + 1 or block['previous_hash'] != previous_hash):
+                    raise ValueError(f"block {block['index']} doesn't link to the previous one")
+                stored = blockchain.db.get_by_index(block['index'])
+                if stored is not None:
+                    if blockchain.cache.hash(stored) != computed:
+                        raise ValueError(f"block {block['index']} differs from the stored chain")
+                else:
+                    batch.append(block)
+                previous_block = block
+                previous_hash = computed
+            trusted_batch = [block for block in batch if block['index'] <= height]
+            if trusted_batch:
+                blockchain.db.append_batch(trusted_batch)
+                blockchain.cache.clear()
+            if height and previous_block is not None and previous_block['index'] == height:
+                if previous_hash != manifest['hash']:
+                    raise ValueError(f'block {height} hash differs from the snapshot hash')
+                balances = dict(_read_gzip(directory, manifest['state']['file'], manifest['state']['sha256']))
+                blockchain.state.restore(balances, height)
+                blockchain.miner.stop()
+                height = 0
+            batch = [block for block in batch if block['index'] > blockchain.last_block['index']]
+            if batch and not blockchain.append_blocks(batch):
+                raise ValueError(f"invalid block in {chunk['file']}")
+        if height:
+            raise ValueError(f"snapshot blocks don't reach height {height}")
+    return blockchain.last_block['index']
+
+
+if __name__ == '__main__':
+    # snapshot.py export DIRECTORY | snapshot.py blocks DIRECTORY START [END] | snapshot.py import DIRECTORY
+    from blockchain import Blockchain
+    from config import PUBLIC_KEY, SECRET_KEY, SNAPSHOT_SIGNERS
+    command, directory = sys.argv[1:3]
+    blockchain = Blockchain()
+    if command == 'export':
+        blockchain.validate_chain()
+        print(export_snapshot(blockchain, directory, PUBLIC_KEY, SECRET_KEY)['height'])
+    elif command == 'blocks':
+        print(len(export_blocks(blockchain, directory, *map(int, sys.argv[3:5]))['chunks']))
+    elif command == 'import':
+        print(import_snapshot(blockchain, directory, SNAPSHOT_SIGNERS))
@@ -0,0 +1,82 @@
+from collections import ChainMap
+from storage import Storage
+
+UNDO_DEPTH = 1000
+
+
+class StateStore:
+    """Account balances persisted in storage.
+
+    Every applied block writes an undo record with the previous balances of
+    the accounts it touched, so the last UNDO_DEPTH blocks can be rolled back.
+    """
+
+    def __init__(self, db: Storage):
+        self.db = db
+        self.balances, self.height = db.state_get()
+        self._recover()
+
+    def _recover(self):
+        """Revert a block which was applied only partially"""
+        for undo in self.db.undo_get(self.height):
+            self._write(dict(undo['balances']), self.height)
+        self.db.undo_delete(self.height + 1)
+
+    def _write(self, balances: dict, height: int):
+        for public_key, balance in balances.items():
+            if balance is None:
+                self.balances.pop(public_key, None)
+            else:
+                self.balances[public_key] = balance
+        self.db.state_put(balances, height)
+        self.height = height
+
+    def get(self, public_key: str) -> float:
+        return self.balances.get(public_key, 0)
+
+    def apply_block(self, block: dict, balances: dict):
+        """Store new balances of accounts touched by block"""
+        self.apply_blocks([(block, balances)])
+
+    def apply_blocks(self, blocks: list[tuple[dict, dict]]):
+        """Apply consecutive (block, balances) pairs with one write per collection"""
+        if not blocks:
+            return
+        current = ChainMap({}, self.balances)
+        undo = []
+        index = self.height
+        for block, balances in blocks:
+            index += 1
+            if block['index'] != index:
+                raise ValueError(f"block {block['index']} can't be applied on state at {index - 1}")
+            undo.append({'index': index, 'balances': [[key, current.get(key)] for key in balances]})
+            current.update(balances)
+        self.db.undo_delete(self.height + 1)
+        self.db.undo_put(undo)
+        self._write(current.maps[0], index)
+        self.db.undo_delete(0, self.height - UNDO_DEPTH + 1)
+
+    def can_rollback(self, index: int) -> bool:
+        return self.db.undo_count(index) >= self.height - index
+
+    def rollback(self, index: int):
+        """Revert blocks above index"""
+        if index >= self.height:
+            return
+        if not self.can_rollback(index):
+            raise ValueError(f'no undo records to roll back state from {self.height} to {index}')
+        for undo in self.db.undo_get(index):
+            self._write(dict(undo['balances']), undo['index'] - 1)
+            self.db.undo_delete(undo['index'], undo['index'] + 1)
+
+    def restore(self, balances: dict, height: int):
+        """Replace state with balances trusted to be valid at height, e.g. from a snapshot"""
+        self.reset()
+        self.balances = {}
+        self._write(dict(balances), height)
+
+    def reset(self):
+        """Drop all state, blocks have to be applied again from genesis"""
+        self.db.state_clear()
+        self.balances = {}
+        self.height = 1
@@ -0,0 +1,107 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator
+from blockchain_utils import EMISSION_ADDRESS
+
+GENESIS_BLOCK = {
+    'index': 1,
+    'timestamp': 1696793687.5292575,
+    'transactions': [],
+    'proof': 100,
+    'previous_hash': 1,
+    'difficult': 6,
+    'reward': 50
+}
+
+
+class Storage(ABC):
+    """Blocks by index plus account state and its undo records.
+
+    Blocks are only appended on top of the tip or truncated from some index,
+    state balances set to None are deleted. Transaction and address indexes
+    are maintained by append_batch and truncate_from, they are written before
+    the blocks and leftovers of a failed append are dropped first.
+    """
+
+    @abstractmethod
+    def get_by_index(self, index: int) -> dict | None:
+        ...
+
+    @abstractmethod
+    def tip(self) -> dict:
+        ...
+
+    @abstractmethod
+    def range(self, start: int, end: int = None) -> Iterator[dict]:
+        """Blocks with index in [start, end) in order, to the tip if end is None"""
+
+    @abstractmethod
+    def append_batch(self, blocks: Iterable[dict]):
+        ...
+
+    @abstractmethod
+    def truncate_from(self, index: int):
+        """Remove blocks with index >= index"""
+
+    @abstractmethod
+    def transaction_location(self, transaction_hash: str) -> tuple[int, int] | None:
+        """(block index, position in block) of a stored transaction"""
+
+    @abstractmethod
+    def address_history(self, address: str, offset: int, limit: int) -> list[tuple[int, int, str]]:
+        """(block index, position, transaction hash) of transactions sent or received by address, newest first"""
+
+    @abstractmethod
+    def reindex(self):
+        """Rebuild transaction and address indexes from stored blocks"""
+
+    @abstractmethod
+    def state_get(self) -> tuple[dict, int]:
+        """All balances and index of the last block applied to them"""
+
+    @abstractmethod
+    def state_put(self, balances: dict, height: int):
+        ...
+
+    @abstractmethod
+    def state_clear(self):
+        """Drop balances and undo records"""
+
+    @abstractmethod
+    def undo_put(self, records: list[dict]):
+        """Replace undo records, each one is {'index': ..., 'balances': [[key, previous balance], ...]}"""
+
+    @abstractmethod
+    def undo_get(self, above: int) -> list[dict]:
+        """Undo records with index > above, newest first"""
+
+    @abstractmethod
+    def undo_count(self, above: int) -> int:
+        ...
+
+    @abstractmethod
+    def undo_delete(self, start: int, end: int = None):
+        """Remove undo records with index in [start, end)"""
+
+    def close(self):
+        pass
+
+
+def index_entries(blocks: Iterable[dict]) -> tuple[list[tuple], list[tuple]]:
+    """(hash, block, position) rows of the transaction index and (address, block, position, hash) rows of the
+    address index, the emission address is not indexed"""
+    transactions = []
+    history = []
+    for block in blocks:
+        for position, transaction in enumerate(block['transactions']):
+            transactions.append((transaction['hash'], block['index'], position))
+            for address in {transaction['sender'], transaction['recipient']} - {EMISSION_ADDRESS}:
+                history.append((address, block['index'], position, transaction['hash']))
+    return transactions, history
+
+
+def open_storage(kind: str, path: str) -> Storage:
+    if kind == 'file':
+        from file_storage import FileStorage
+        return FileStorage(path)
+    from mongo_db import Mongo
+    return Mongo()
@@ -0,0 +1,143 @@
+import asyncio
+from collections import deque
+from blockchain_utils import block_hash
+from metrics import metrics
+
+PAGE_SIZE = 500
+HEADERS_PAGE_SIZE = 5000
+WINDOW = 8
+MAX_BLOCKS = 100_000
+
+
+class BlockSync:
+    """Initial block download from several peers.
+
+    With headers_first the header chain of the tallest peer is fetched and its
+    proof of work checked before any body is downloaded, bodies are then
+    matched against header hashes. Pages are requested from all peers which
+    are high enough, up to `window` pages are in flight while earlier pages
+    are validated and stored in order. A round syncs at most MAX_BLOCKS blocks
+    above the local height, the next round continues from there.
+    """
+
+    def __init__(self, blockchain, window: int = WINDOW, page_size: int = PAGE_SIZE, headers_first: bool = True):
+        self.blockchain = blockchain
+        self.window = window
+        self.page_size = page_size
+        self.headers_first = headers_first
+
+    async def fetch(
+            self, nodes: list[str],
+            start: int,
+            length: int,
+            path: str = '/block/range',
+            hashes: list[str] = None) -> list[dict] | None:
+        """Page from the first peer which returns it in full and matching expected hashes"""
+        for node in nodes:
+            blocks = await self.blockchain.peers.request(node, 'GET', path, params={'start': start, 'length': length})
+            if not blocks or len(blocks) != length or blocks[0]['index'] != start:
+                continue
+            if hashes is not None and any(block_hash(block) != value for block, value in zip(blocks, hashes)):
+                continue
+            return blocks
+        return None
+
+    async def fetch_headers(self, nodes: list[str], previous_block: dict, end: int) -> list[dict]:
+        """Valid headers above previous_block up to end, `window` pages at a time,
+        stops at the first page no peer returned or which is not valid"""
+        epochs = self.blockchain.schedule.view(previous_block['index'])
+        pages = range(previous_block['index'] + 1, end + 1, HEADERS_PAGE_SIZE)
+        headers = []
+        for first in range(0, len(pages), self.window):
+            window = await asyncio.gather(*(
+                self.fetch(nodes, page, min(HEADERS_PAGE_SIZE, end - page + 1), '/block/headers')
+                for page in pages[first:first + self.window]
+            ))
+            for page in window:
+                if page is None:
+                    return headers
+                valid = self.blockchain.validate_headers(page, previous_block, epochs)
+                headers.extend(page[:valid])
+                if valid < len(page):
+                    return headers
+                previous_block = page[-1]
+        return headers
+
+    async def find_fork(self, node: str, height: int) -> int | None:
+        """Highest block index shared with peer"""
+        end = height
+        while end > 1:
+            start = max(1, end - self.page_size + 1)
+            headers = await self.fetch([node], start, end - start + 1, '/block/headers')
+            if headers is None:
+                return None
+            for header in reversed(headers):
+                if block_hash(header) == self.blockchain.cache.hash(self.blockchain.block_by_index(header['index'])):
+                    return header['index']
+            end = start - 1
+        return 1
+
+    async def run(self) -> bool:
+        """Return True if the chain got longer"""
+        with metrics.timer('sync_seconds'):
+            return await self._run()
+
+    async def _run(self) -> bool:
+        height = self.blockchain.last_block['index']
+        heights = {node: value for node, value in (await self.blockchain.peers.heights()).items() if value > height}
+        if not heights:
+            return False
+        nodes = sorted(heights, key=heights.get, reverse=True)
+        fork = await self.find_fork(nodes[0], height)
+        if fork is None:
+            return False
+        target = min(heights[nodes[0]], height + MAX_BLOCKS)
+        hashes = None
+        if self.headers_first:
+            headers = await self.fetch_headers(nodes, self.blockchain.block_by_index(fork), target)
+            if fork + len(headers) <= height:
+                return False
+            target = fork + len(headers)
+            hashes = [header['hash'] for header in headers]
+        replaced = []
+        if fork < height:
+            replaced = list(self.blockchain.blocks(fork + 1, height - fork))
+            await asyncio.to_thread(self.blockchain.rollback, fork)
+        pages = deque(
+            (start, min(self.page_size, target - start + 1))
+            for start in range(fork + 1, target + 1, self.page_size)
+        )
+        in_flight = deque()
+        turn = 0
+
+        def schedule():
+            nonlocal turn
+            while pages and len(in_flight) < self.window:
+                start, length = pages.popleft()
+                candidates = [node for node in nodes if heights[node] >= start + length - 1]
+                candidates = candidates[turn % len(candidates):] + candidates[:turn % len(candidates)]
+                turn += 1
+                expected = hashes[start - fork - 1:start - fork - 1 + length] if hashes else None
+                in_flight.append(asyncio.create_task(self.fetch(candidates, start, length, hashes=expected)))
+
+        schedule()
+        try:
+            try:
+                while in_flight:
+                    blocks = await in_flight.popleft()
+                    schedule()
+                    if blocks is None or not await asyncio.to_thread(self.blockchain.append_blocks, blocks):
+                        break
+            finally:
+                for task in in_flight:
+                    task.cancel()
+        finally:
+            if replaced and self.blockchain.last_block['index'] <= height:
+                await asyncio.to_thread(self.restore, fork, replaced)
+        return self.blockchain.last_block['index'] > height
+
+    def restore(self, fork: int, blocks: list[dict]):
+        """Put back blocks above fork which a shorter or invalid branch replaced"""
+        with self.blockchain.lock:
+            self.blockchain.rollback(fork)
+            self.blockchain.append_blocks(blocks)
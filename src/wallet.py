@@ -1,21 +1,63 @@
-import requests
-from config import NODES
-from api import blockchain
+import time
+import httpx
+from client import NodeClient
+from config import NODE_URL, NODES
 from keygen import generate_ecdsa_keys
 from utils import console_clear, get_logo
 
+node = NodeClient(NODE_URL)
+
+
+def mine_forever():
+    """Run mining service of the node until Ctrl+C, it is the one controlled by /mining/* on the API"""
+    node.start_mining()
+    try:
+        while True:
+            status = node.mining_status()
+            print(status)
+            if not status['running']:
+                break
+            time.sleep(10)
+    finally:
+        node.stop_mining()
+
+
+def read_transfers(filename: str) -> list[tuple[str, float, float]]:
+    """recipient,amount,fee per line"""
+    transfers = []
+    with open(filename) as file:
+        for line in file:
+            if line.strip():
+                recipient, amount, fee = line.strip().split(',')
+                transfers.append((recipient.strip(), float(amount), float(fee)))
+    return transfers
+
+
+def confirm_transaction(transaction_hash: str, index: int) -> bool:
+    """Check Merkle proof of transaction in block index, the node and its peers have to agree on the block header"""
+    headers = set()
+    for client in [node] + [NodeClient(url) for url in NODES if url != NODE_URL]:
+        try:
+            result = client.transaction_proof(transaction_hash, index)
+        except httpx.HTTPError:
+            continue
+        if result is None:
+            return False
+        headers.add(result['header']['hash'])
+    return len(headers) == 1
+
 
 def wallet():
     response = None
-    blockchain.validate_chain()
-    blockchain.consensus()
     while response not in ['1', '2', '3']:
         response = input("""What do you want to do?
             1. Generate new wallet
             2. Send coins to another wallet 
             3. Check balance
             4. Main blocks
-            5. Quit
+            5. Confirm transaction
+            6. Send coins from file (recipient,amount,fee per line)
+            7. Quit
             """)
         if response == '1':
             console_clear()
@@ -35,25 +77,31 @@ def wallet():
             print(F"From: {addr_from}\nPrivate Key: {private_key}\nTo: {addr_to}\nAmount: {amount}\n")
             response = input("y/n\n")
             if response.lower() == 'y':
-                transaction = (blockchain.new_transaction
-                               (addr_from,
-                                addr_to,
-                                amount,
-                                fee,
-                                private_key)
-                               )
-                for node in NODES:
-                    requests.post(node + '/transactions/get', json=transaction)
+                print(node.send(addr_from, private_key, [(addr_to, float(amount), float(fee))])[0])
             elif response.lower() == 'n':
                 continue
         elif response == '3':
             console_clear()
             addr_from = input("Introduce your wallet address (public key)\n")
-            print(blockchain.check_balance(addr_from))
+            print(node.balance(addr_from))
         elif response == '4':
             console_clear()
-            while True:
-                blockchain.mine()
+            mine_forever()
+        elif response == '5':
+            console_clear()
+            transaction_hash = input("Introduce transaction hash\n")
+            index = int(input("Introduce block index\n"))
+            print(confirm_transaction(transaction_hash, index))
+        elif response == '6':
+            console_clear()
+            addr_from = input("From: introduce your wallet address (public key)\n")
+            private_key = input("Introduce your private key\n")
+            transfers = read_transfers(input("Introduce path to the file\n"))
+            statuses = node.send(addr_from, private_key, transfers)
+            print(f"{sum(statuses)} of {len(statuses)} transactions accepted")
+            for (recipient, amount, fee), status in zip(transfers, statuses):
+                if not status:
+                    print(f"Rejected: {recipient} {amount} {fee}")
         else:
             return
     print('')